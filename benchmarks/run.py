@@ -0,0 +1,273 @@
+# coding=utf-8
+"""
+Offline microbenchmarks for TMDbie's hot paths, using the recorded responses in fixtures/
+
+    python benchmarks/run.py                       # run everything, compare with the baseline
+    python benchmarks/run.py --filter cache        # only benchmarks containing "cache"
+    python benchmarks/run.py --sizes 10000,1000000 # cache sizes to test
+    python benchmarks/run.py --save                # store the results as the new baseline
+
+Reports operations per second and the peak memory allocated by a single operation
+"""
+import argparse
+import importlib
+import itertools
+import json
+import os
+import random
+import sys
+import timeit
+import tracemalloc
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+
+from tmdbie import Movie, TVShow, Person, Endpoints, Connector  # noqa: E402
+from tmdbie.cache_manager import CacheManager  # noqa: E402
+from tmdbie.export_index import ExportIndex  # noqa: E402
+from tmdbie.utils import instantiate_type  # noqa: E402
+
+DEFAULT_BASELINE = os.path.join(HERE, "baseline.json")
+
+# name -> setup(size), setup returns the function to measure
+BENCHMARKS = []
+
+
+def benchmark(name, sized=False):
+    def decorator(setup):
+        BENCHMARKS.append((name, setup, sized))
+        return setup
+    return decorator
+
+
+def load_fixture(name) -> bytes:
+    with open(os.path.join(HERE, "fixtures", name), "rb") as f:
+        return f.read()
+
+
+def new_cache(**kwargs) -> CacheManager:
+    # Bypass the singleton so every benchmark gets its own instance
+    cache = object.__new__(CacheManager)
+    cache.__init__(**kwargs)
+    return cache
+
+
+def fill_cache(size: int) -> CacheManager:
+    cache = new_cache(max_entries=size, sweep_interval=None)
+    entry = json.loads(load_fixture("search_multi.json"))["results"][0]
+
+    for i in range(size):
+        cache.item_set(Movie.from_response(dict(entry, id=i, title="Movie number {}".format(i))))
+
+    return cache
+
+
+# Connector
+
+@benchmark("connector.build_url")
+def _build_url(_):
+    return lambda: Connector._build_url(Endpoints.Search.MULTI, query="the matrix", page=1, api_key="0" * 32, language="en-US")
+
+
+# JSON decoding
+
+def _decoder_benchmarks():
+    for module_name in ("json", "ujson", "orjson"):
+        for fixture in ("search_multi.json", "movie_details.json"):
+            def setup(_, module_name=module_name, fixture=fixture):
+                try:
+                    loads = importlib.import_module(module_name).loads
+                except ImportError:
+                    return None
+
+                body = load_fixture(fixture)
+                return lambda: loads(body)
+
+            benchmark("decode.{}.{}".format(module_name, fixture.split(".")[0]))(setup)
+
+
+_decoder_benchmarks()
+
+
+# Types
+
+@benchmark("types.movie.search_entry")
+def _movie_entry(_):
+    entry = json.loads(load_fixture("search_multi.json"))["results"][0]
+    return lambda: Movie.from_response(entry)
+
+
+@benchmark("types.movie.search_entry.lazy")
+def _movie_entry_lazy(_):
+    entry = json.loads(load_fixture("search_multi.json"))["results"][0]
+    return lambda: Movie.from_response(entry, lazy=True)
+
+
+@benchmark("types.movie.details")
+def _movie_details(_):
+    details = json.loads(load_fixture("movie_details.json"))
+    return lambda: Movie.from_response(details)
+
+
+@benchmark("types.movie.details.lazy.project")
+def _movie_details_project(_):
+    details = json.loads(load_fixture("movie_details.json"))
+    return lambda: Movie.from_response(details, lazy=True, project=True)
+
+
+@benchmark("types.tvshow.details")
+def _tv_details(_):
+    details = json.loads(load_fixture("tv_details.json"))
+    return lambda: TVShow.from_response(details)
+
+
+@benchmark("types.person.known_for")
+def _person(_):
+    entry = [a for a in json.loads(load_fixture("search_multi.json"))["results"] if a["media_type"] == "person"][0]
+    return lambda: Person.from_response(entry)
+
+
+@benchmark("utils.instantiate_type.page")
+def _instantiate_page(_):
+    results = json.loads(load_fixture("search_multi.json"))["results"]
+    return lambda: [instantiate_type(entry) for entry in results]
+
+
+@benchmark("utils.instantiate_type.page.lazy")
+def _instantiate_page_lazy(_):
+    results = json.loads(load_fixture("search_multi.json"))["results"]
+    return lambda: [instantiate_type(entry, lazy=True) for entry in results]
+
+
+# CacheManager
+
+@benchmark("cache.item_set", sized=True)
+def _cache_set(size):
+    cache = fill_cache(size)
+    items = list(cache.cache.values())
+    random.shuffle(items)
+    it = itertools.cycle(items)
+
+    return lambda: cache.item_set(next(it))
+
+
+@benchmark("cache.get_item_by_id", sized=True)
+def _cache_get_id(size):
+    cache = fill_cache(size)
+    ids = [random.randrange(size) for _ in range(10000)]
+    it = itertools.cycle(ids)
+
+    return lambda: cache.get_item_by_id(next(it), media_type="movie")
+
+
+@benchmark("cache.get_item_by_name", sized=True)
+def _cache_get_name(size):
+    cache = fill_cache(size)
+    names = ["movie number {}".format(random.randrange(size)) for _ in range(10000)]
+    it = itertools.cycle(names)
+
+    return lambda: cache.get_item_by_name(next(it))
+
+
+@benchmark("cache.get_item_by_name.canonical", sized=True)
+def _cache_get_canonical(size):
+    cache = fill_cache(size)
+    names = ["The Movie Number {} (1999)".format(random.randrange(size)) for _ in range(10000)]
+    it = itertools.cycle(names)
+
+    return lambda: cache.get_item_by_name(next(it))
+
+
+@benchmark("cache.get_item_by_name.miss", sized=True)
+def _cache_get_miss(size):
+    cache = fill_cache(size)
+    return lambda: cache.get_item_by_name("a title that is not cached")
+
+
+@benchmark("cache.get_item_by_name.near_miss", sized=True)
+def _cache_get_near_miss(size):
+    cache = fill_cache(size)
+    # Shares every trigram with all cached titles, but isn't one of them
+    return lambda: cache.get_item_by_name("movie numbers", fuzzy=True)
+
+
+# ExportIndex
+
+@benchmark("export_index.load")
+def _export_load(_):
+    path = os.path.join(HERE, "fixtures", "movie_ids_export.json")
+    return lambda: ExportIndex().load(path, media_type="movie")
+
+
+@benchmark("export_index.lookup", sized=True)
+def _export_lookup(size):
+    index = ExportIndex()
+    for i in range(size):
+        index.add("Movie number {}".format(i), "movie", i, popularity=1.0)
+
+    names = ["The Movie Number {}".format(random.randrange(size)) for _ in range(10000)]
+    it = itertools.cycle(names)
+
+    return lambda: index.lookup(next(it))
+
+
+# Runner
+
+def measure(func, repeat=3) -> dict:
+    timer = timeit.Timer(func)
+    number, _ = timer.autorange()
+    best = min(timer.repeat(repeat=repeat, number=number))
+
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {"ops": number / best, "peak_bytes": peak}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--filter", default="", help="only run benchmarks whose name contains this")
+    parser.add_argument("--sizes", default="10000,100000", help="comma separated cache sizes")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="baseline file to compare with")
+    parser.add_argument("--save", action="store_true", help="save the results as the new baseline")
+    args = parser.parse_args()
+
+    sizes = [int(a) for a in args.sizes.split(",") if a]
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    results = {}
+    print("{:<48} {:>14} {:>12} {:>10}".format("benchmark", "ops/sec", "peak bytes", "vs base"))
+
+    for name, setup, sized in BENCHMARKS:
+        for size in (sizes if sized else [None]):
+            full_name = name if size is None else "{}[{}]".format(name, size)
+            if args.filter not in full_name:
+                continue
+
+            func = setup(size)
+            if func is None:
+                print("{:<48} {:>14}".format(full_name, "skipped"))
+                continue
+
+            result = results[full_name] = measure(func)
+
+            previous = baseline.get(full_name)
+            change = "{:+.1%}".format(result["ops"] / previous["ops"] - 1) if previous else "-"
+
+            print("{:<48} {:>14,.0f} {:>12,} {:>10}".format(full_name, result["ops"], result["peak_bytes"], change))
+
+    if args.save:
+        baseline.update(results)
+        with open(args.baseline, "w") as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+        print("Saved baseline to {}".format(args.baseline))
+
+
+if __name__ == "__main__":
+    main()
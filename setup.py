@@ -7,6 +7,7 @@ with open('requirements.txt') as f:
 
 extras = {
     "fast": ["ujson>=1.35"],
+    "orjson": ["orjson>=2.0"],
     "requests": ["requests>=2.13.0"]
 }
 
@@ -16,7 +17,7 @@ setup(name='TMDbie',
       classifiers=[
           'Development Status :: 4 - Beta',
           'License :: OSI Approved :: MIT License',
-          'Programming Language :: Python :: 3.5',
+          'Programming Language :: Python :: 3.6',
           'Intended Audience :: Developers',
       ],
       url='https://github.com/DefaltSimon/TMDbie',
@@ -15,3 +15,10 @@ from .types import Person, TVShow, Movie, Endpoints
 from .client import Client
 from .exceptions import TMDbException, HTTPException, APIException, RatelimitException, DecodeError
 from .connector import AioHttpConnector, UrllibConnector, RequestsConnector, Connector
+from .storage import Storage, SQLiteStorage
+from .cache_backend import CacheBackend, LocalCacheBackend, SharedCacheBackend
+from .export_index import ExportIndex
+from .warmer import CacheWarmer, QueryLog
+from .ratelimit import RateLimiter, Priority
+from .resilience import RetryPolicy
+from .metrics import Metrics, NullMetrics
@@ -1,3 +1,144 @@
 # coding=utf-8
 class TMDbType:
-    pass
+    """
+    Base for Movie, TVShow and Person
+
+    Responses are mapped onto attributes with a per-class dispatch table (see compile_fields):
+    _fields maps response keys to a handler(obj, value), None meaning the value is stored as-is
+    and _derived maps attributes to the response keys they're built from.
+
+    Lazy instances only keep the raw response and set attributes on first access,
+    with project=True keys that no handler uses are dropped from it first.
+
+    Partial instances (see Client.search_multi with details=False) only have what a search result has,
+    attributes listed in _details_only are fetched with load() or aget()
+    """
+    # __weakref__ so instances can be kept in an IdentityMap
+    __slots__ = ("_raw", "_loader", "_appended", "__weakref__")
+
+    _fields = {}
+    _derived = {}
+    _details_only = ()
+
+    def __init__(self, **kwargs):
+        self._set_attributes(**kwargs)
+
+    @classmethod
+    def from_response(cls, data: dict, lazy=False, project=False):
+        obj = cls.__new__(cls)
+
+        if lazy:
+            obj._raw = cls.project(data) if project else data
+        else:
+            obj._hydrate(data)
+
+        return obj
+
+    @classmethod
+    def project(cls, data: dict) -> dict:
+        """
+        Returns only the keys of a response that are used by this type
+        """
+        fields = cls._fields
+        return {key: value for key, value in data.items() if key in fields}
+
+    def _set_attributes(self, **kwargs):
+        self._hydrate(kwargs)
+
+    def _hydrate(self, data: dict):
+        fields = self._fields
+        for key, value in data.items():
+            if key not in fields:
+                continue
+
+            handler = fields[key]
+            if handler is None:
+                setattr(self, key, value)
+            else:
+                handler(self, value)
+
+    @property
+    def is_partial(self) -> bool:
+        return is_partial(self)
+
+    async def load(self):
+        """
+        Fetches the details of a partial instance (a no-op otherwise), returns the instance itself
+        """
+        loader = peek(self, "_loader")
+        if loader is not None:
+            await loader(self)
+        return self
+
+    async def aget(self, name, default=None):
+        """
+        Awaitable getattr that loads the details first if a partial instance doesn't have the attribute yet
+        """
+        value = getattr(self, name, None)
+        if value is None and name in self._details_only and is_partial(self):
+            await self.load()
+            value = getattr(self, name, None)
+
+        return default if value is None else value
+
+    def __getattr__(self, name):
+        # Only called when the attribute isn't set, which is where lazy instances fill it in
+        if name == "_raw":
+            raise AttributeError(name)
+
+        keys = type(self)._derived.get(name)
+        if keys:
+            try:
+                raw = self._raw
+            except AttributeError:
+                pass
+            else:
+                fields = self._fields
+                for key in keys:
+                    if key not in raw:
+                        continue
+
+                    handler = fields[key]
+                    if handler is None:
+                        setattr(self, key, raw[key])
+                    else:
+                        handler(self, raw[key])
+
+                return object.__getattribute__(self, name)
+
+        raise AttributeError("'{}' object has no attribute '{}'".format(type(self).__name__, name))
+
+
+def peek(obj, name, default=None):
+    """
+    getattr that doesn't build attributes of lazy instances (for use in handlers)
+    """
+    try:
+        return object.__getattribute__(obj, name)
+    except AttributeError:
+        return default
+
+
+def is_partial(obj) -> bool:
+    """
+    True for instances built from a search result whose details weren't loaded yet
+    """
+    return peek(obj, "_loader") is not None
+
+
+def compile_fields(cls, handlers: dict):
+    """
+    Builds the dispatch tables of a TMDbType subclass
+    handlers maps response keys to (handler, attributes the handler sets)
+    """
+    fields = {slot: None for slot in cls.__slots__}
+    # Attributes that are stored as-is come from the key with the same name first
+    derived = {slot: [slot] for slot in cls.__slots__ if slot not in handlers}
+
+    for key, (handler, attributes) in handlers.items():
+        fields[key] = handler
+        for attribute in attributes:
+            derived.setdefault(attribute, []).append(key)
+
+    cls._fields = fields
+    cls._derived = {attribute: tuple(keys) for attribute, keys in derived.items()}
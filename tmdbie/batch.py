@@ -0,0 +1,125 @@
+# coding=utf-8
+"""
+Batched lookups for TMDbie
+"""
+import asyncio
+import logging
+
+log = logging.getLogger(__name__)
+log.setLevel(logging.INFO)
+
+
+class Batch:
+    """
+    Results of a batched lookup
+
+    Awaiting it returns all results as a list (in the same order as the input), while
+    iterating over it with async for yields (index, result) tuples, either in order or as they complete.
+    Cached results come from lookup() (a coroutine function returning a list, None marking a miss),
+    misses are fetched with fetch(index) with at most `limit` of them in flight at once
+    """
+    def __init__(self, size: int, fetch, lookup=None, limit=8, as_completed=False):
+        self._results = [None] * size
+        self._fetch = fetch
+        self._lookup = lookup
+        self._limit = max(1, int(limit))
+        self.as_completed = as_completed
+
+        self._tasks = None
+        self._pending = None
+        self._position = 0
+
+    def __len__(self):
+        return len(self._results)
+
+    async def _start(self):
+        if self._tasks is not None:
+            return
+
+        if self._lookup is not None:
+            hits = list(await self._lookup())
+            # Another caller might have started the batch in the meantime
+            if self._tasks is not None:
+                return
+            self._results = hits
+
+        semaphore = asyncio.Semaphore(self._limit)
+
+        async def bounded(index):
+            async with semaphore:
+                return await self._fetch(index)
+
+        self._tasks = {index: asyncio.ensure_future(bounded(index))
+                       for index, result in enumerate(self._results) if result is None}
+        self._pending = set(self._tasks.values())
+
+        if self.as_completed:
+            # Cached results are already complete
+            self._ready = [(index, result) for index, result in enumerate(self._results) if index not in self._tasks]
+            self._task_to_index = {task: index for index, task in self._tasks.items()}
+
+        log.debug("Batch of {}: {} cached, {} to fetch".format(len(self._results), len(self._results) - len(self._tasks), len(self._tasks)))
+
+    def cancel(self):
+        """
+        Cancels all lookups that haven't finished yet
+        """
+        for task in (self._tasks or {}).values():
+            task.cancel()
+
+    async def _gather(self):
+        await self._start()
+
+        try:
+            for index, task in self._tasks.items():
+                self._results[index] = await task
+        except BaseException:
+            self.cancel()
+            raise
+
+        return self._results
+
+    def __await__(self):
+        return self._gather().__await__()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        try:
+            await self._start()
+
+            if self.as_completed:
+                return await self._next_completed()
+            else:
+                return await self._next_in_order()
+        except StopAsyncIteration:
+            raise
+        except BaseException:
+            self.cancel()
+            raise
+
+    async def _next_in_order(self):
+        if self._position >= len(self._results):
+            raise StopAsyncIteration
+
+        index = self._position
+        self._position += 1
+
+        if index in self._tasks:
+            self._results[index] = await self._tasks[index]
+
+        return index, self._results[index]
+
+    async def _next_completed(self):
+        if not self._ready:
+            if not self._pending:
+                raise StopAsyncIteration
+
+            done, self._pending = await asyncio.wait(self._pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                index = self._task_to_index[task]
+                self._results[index] = task.result()
+                self._ready.append((index, self._results[index]))
+
+        return self._ready.pop(0)
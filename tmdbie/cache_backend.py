@@ -0,0 +1,242 @@
+# coding=utf-8
+"""
+Cache backends used by the Client
+"""
+import asyncio
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from .abstract import is_partial
+from .cache_manager import CacheManager, get_media_type, normalize_query
+from .storage import SQLiteStorage
+
+log = logging.getLogger(__name__)
+log.setLevel(logging.INFO)
+
+
+class CacheBackend:
+    """
+    Async interface between the Client and its cache
+
+    Every backend has an in-process CacheManager (manager), which is also used for
+    things that are only relevant locally, like staleness checks
+    """
+    def __init__(self, manager: CacheManager):
+        self.manager = manager
+
+    @property
+    def stale_grace(self):
+        return self.manager.stale_grace
+
+    async def is_stale(self, item) -> bool:
+        raise NotImplementedError
+
+    async def expires_in(self, key):
+        """
+        Seconds until a cached (media_type, id) entry goes stale (see CacheManager.expires_in)
+        """
+        raise NotImplementedError
+
+    async def get_entry(self, key):
+        """
+        The cached item for a (media_type, id) key regardless of its age, without counting a hit/miss
+        """
+        raise NotImplementedError
+
+    async def find_key(self, search, media_type=None):
+        """
+        The (media_type, id) key of a cached item regardless of its age (see CacheManager.find_key)
+        """
+        raise NotImplementedError
+
+    async def get(self, search, media_type=None, allow_stale=False):
+        raise NotImplementedError
+
+    async def get_many(self, searches, media_type=None, allow_stale=False) -> list:
+        raise NotImplementedError
+
+    async def get_expired(self, search, media_type=None):
+        """
+        An item that is too old to be served, but can be revalidated (see CacheManager.get_expired)
+        """
+        raise NotImplementedError
+
+    async def set(self, item):
+        raise NotImplementedError
+
+    async def touch(self, item):
+        raise NotImplementedError
+
+    async def remember_query(self, query, item):
+        raise NotImplementedError
+
+    async def is_negative(self, query) -> bool:
+        raise NotImplementedError
+
+    async def set_negative(self, query):
+        raise NotImplementedError
+
+    async def close(self):
+        pass
+
+
+class LocalCacheBackend(CacheBackend):
+    """
+    Only uses the (process-local) CacheManager
+
+    If the manager has a storage backend (see storage.py), every call runs in a single worker thread,
+    so its disk I/O never blocks the event loop and the manager is only ever changed from that thread
+    """
+    def __init__(self, manager: CacheManager, executor=None):
+        super().__init__(manager)
+
+        # If custom, it must have a single worker and it's not shut down on close
+        self.executor = executor
+        self._own_executor = None
+
+    async def _run(self, func, *args):
+        executor = self.executor
+        if executor is None:
+            if self._own_executor is None:
+                self._own_executor = ThreadPoolExecutor(1)
+            executor = self._own_executor
+
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(executor, func, *args)
+
+    async def _call(self, func, *args, **kwargs):
+        """
+        Calls a CacheManager method, in the worker thread if it touches storage
+        """
+        if self.manager.storage is None:
+            return func(*args, **kwargs)
+
+        return await self._run(partial(func, *args, **kwargs))
+
+    async def is_stale(self, item) -> bool:
+        return await self._call(self.manager.is_stale, item)
+
+    async def expires_in(self, key):
+        return await self._call(self.manager.expires_in, key)
+
+    async def get_entry(self, key):
+        return await self._call(self.manager.get_entry, key)
+
+    async def find_key(self, search, media_type=None):
+        return await self._call(self.manager.find_key, search, media_type=media_type)
+
+    async def get(self, search, media_type=None, allow_stale=False):
+        return await self._call(self.manager.get_from_cache, search, media_type=media_type, allow_stale=allow_stale)
+
+    async def get_many(self, searches, media_type=None, allow_stale=False) -> list:
+        return await self._call(self.manager.get_many_from_cache, searches, media_type=media_type,
+                                allow_stale=allow_stale)
+
+    async def get_expired(self, search, media_type=None):
+        return await self._call(self.manager.get_expired, search, media_type=media_type)
+
+    async def set(self, item):
+        await self._call(self.manager.item_set, item)
+
+    async def touch(self, item):
+        await self._call(self.manager.touch, item)
+
+    async def remember_query(self, query, item):
+        await self._call(self.manager.remember_query, query, item)
+
+    async def is_negative(self, query) -> bool:
+        return await self._call(self.manager.is_negative, query)
+
+    async def set_negative(self, query):
+        await self._call(self.manager.negative_set, query)
+
+    async def close(self):
+        if self._own_executor is not None:
+            self._own_executor.shutdown(wait=False)
+            self._own_executor = None
+
+
+class SharedCacheBackend(LocalCacheBackend):
+    """
+    Cache shared by multiple processes on the same host
+
+    Items are looked up in the in-process CacheManager first and then in a SQLite database in WAL mode,
+    which every process writes its items to. A fetch in one process is therefore a hit in all others.
+    Database access runs in a single worker thread so it never blocks the event loop.
+    Negative entries stay local
+    """
+    def __init__(self, path: str, manager: CacheManager = None, executor=None):
+        super().__init__(CacheManager() if manager is None else manager, executor)
+
+        self.storage = SQLiteStorage(path, wal=True)
+        self._last_sweep = time.time()
+
+    def _load(self, search, media_type):
+        """
+        Finds a stored item by name or id, returns (key, item, timestamp) or None
+        """
+        try:
+            id_ = int(search)
+        except ValueError:
+            key = self.storage.load_key_by_name(normalize_query(search))
+            keys = [key] if key else []
+        else:
+            keys = [(media_type, id_)] if media_type else [(a, id_) for a in ("movie", "tv", "person")]
+
+        for key in keys:
+            stored = self.storage.load(key)
+            if stored is not None:
+                return (key,) + stored
+
+        return None
+
+    async def get(self, search, media_type=None, allow_stale=False):
+        item = await self._call(self.manager.get_from_cache, search, media_type=media_type, allow_stale=allow_stale)
+        if item is not None or search is None:
+            return item
+
+        stored = await self._run(self._load, search, media_type)
+        if stored is None:
+            return None
+
+        key, item, timestamp = stored
+        await self._call(self.manager.item_restore, item, timestamp)
+
+        # The manager decides whether the stored item is still fresh
+        return await self._call(self.manager.get_item_by_id, key[1], media_type=key[0], allow_stale=allow_stale)
+
+    async def get_many(self, searches, media_type=None, allow_stale=False) -> list:
+        return list(await asyncio.gather(*[self.get(search, media_type, allow_stale) for search in searches]))
+
+    async def set(self, item):
+        names = await self._call(self.manager.item_set, item)
+
+        # Partial items can only load their details in this process
+        if is_partial(item):
+            return
+
+        key = (get_media_type(item), int(item.id))
+        timestamp = self.manager.id_to_timestamp.get(key, time.time())
+        await self._run(self.storage.store, key, item, timestamp, names)
+
+        if (time.time() - self._last_sweep) >= (self.manager.sweep_interval or 300):
+            self._last_sweep = time.time()
+            await self._run(self.storage.sweep, self.manager.retention())
+
+    async def touch(self, item):
+        await self._call(self.manager.touch, item)
+
+        key = (get_media_type(item), int(item.id))
+        await self._run(self.storage.touch, key, time.time())
+
+    async def remember_query(self, query, item):
+        await self._call(self.manager.remember_query, query, item)
+
+        key = (get_media_type(item), int(item.id))
+        await self._run(self.storage.store_names, key, (normalize_query(query),))
+
+    async def close(self):
+        await self._run(self.storage.close)
+        await super().close()
@@ -3,13 +3,26 @@
 Cache manager for TMDbie
 """
 import logging
+import sys
 import time
+from collections import OrderedDict
 
-from .abstract import TMDbType
+from .abstract import TMDbType, is_partial
+from .metrics import NullMetrics
+from .title_index import TitleIndex
 
 log = logging.getLogger(__name__)
 log.setLevel(logging.INFO)
 
+# Namespaces are searched in this order when a lookup doesn't specify a media_type
+MEDIA_TYPES = ("movie", "tv", "person")
+
+_CLASS_TO_MEDIA_TYPE = {
+    "Movie": "movie",
+    "TVShow": "tv",
+    "Person": "person",
+}
+
 
 class Singleton(type):
     _instances = {}
@@ -20,43 +33,272 @@ class Singleton(type):
         return cls._instances[cls]
 
 
+def get_media_type(item) -> str:
+    """
+    Returns the media_type namespace an item belongs in
+    """
+    media_type = getattr(item, "media_type", None)
+    if media_type:
+        return media_type
+
+    return _CLASS_TO_MEDIA_TYPE.get(type(item).__name__)
+
+
+def normalize_query(query) -> str:
+    return " ".join(str(query).lower().split())
+
+
+def approximate_size(item) -> int:
+    """
+    Shallow estimate of the memory an item holds (the object and its attribute values)
+    """
+    size = sys.getsizeof(item)
+
+    for cls in type(item).__mro__:
+        for slot in cls.__dict__.get("__slots__", ()):
+            # Don't go through getattr, it would build the attributes of lazy items
+            try:
+                value = object.__getattribute__(item, slot)
+            except AttributeError:
+                continue
+
+            size += _value_size(value)
+
+    return size
+
+
+def _value_size(value) -> int:
+    size = sys.getsizeof(value)
+
+    if isinstance(value, (list, tuple)):
+        size += sum(sys.getsizeof(a) for a in value)
+    elif isinstance(value, dict):
+        size += sum(sys.getsizeof(a) + sys.getsizeof(b) for a, b in value.items())
+
+    return size
+
+
+def get_cache():
+    """
+    Returns the CacheManager instance if it was already created (doesn't create one)
+    """
+    return Singleton._instances.get(CacheManager)
+
+
 class CacheManager(metaclass=Singleton):
-    def __init__(self, max_age=21600):  # 3 hours
-        self.cache = {}
+    """
+    LRU cache for Movie, TVShow and Person objects
+
+    Entries are keyed by (media_type, id), so a movie and a tv show sharing an id don't overwrite each other.
+    The cache is bounded by max_entries and (optionally) an approximate max_bytes budget,
+    expired entries are swept at most once every sweep_interval seconds.
+    If a storage backend is passed (see storage.py), items are written through to it and
+    read back on a miss, so they survive restarts. Storage access is blocking, clients use the manager
+    through a LocalCacheBackend, which calls it from a worker thread when it has storage.
+
+    Queries that returned nothing are remembered separately (negative entries) with their own,
+    shorter max age and size limit, so they never push out actual items.
+
+    With stale_grace, expired items are kept for that many more seconds and can still be
+    requested with allow_stale=True (the client serves them while refreshing in the background).
+    Expired items are also kept for revalidate_grace seconds without ever being served (see get_expired),
+    so the client can revalidate them with a conditional request instead of downloading them again.
+
+    Names that don't match exactly fall back to the title index (see title_index.py), which matches
+    normalized titles, including original titles. With fuzzy=True, it also matches similar titles
+    with at least fuzzy_threshold confidence
+    """
+    def __init__(self, max_age=21600, max_entries=10000, max_bytes=None, sweep_interval=300, storage=None,
+                 negative_max_age=600, max_negative_entries=2000, stale_grace=0, fuzzy_threshold=0.8,
+                 revalidate_grace=86400):  # 3 hours
+        # (media_type, id) -> item, least recently used first
+        self.cache = OrderedDict()
 
         self.name_to_id = {}
         self.id_to_timestamp = {}
 
+        # Reverse indexes so entries can be fully removed on eviction
+        self._key_to_names = {}
+        self._key_to_size = {}
+        self.total_size = 0
+
         self.max_cache_age = int(max_age)
+        self.stale_grace = int(stale_grace)
+        self.revalidate_grace = int(revalidate_grace)
+        self.max_entries = int(max_entries) if max_entries else None
+        self.max_bytes = int(max_bytes) if max_bytes else None
+
+        self.sweep_interval = sweep_interval
+        self._last_sweep = time.time()
+
+        self.storage = storage
+        self.title_index = TitleIndex(fuzzy_threshold)
+
+        # Replaced by the client's metrics
+        self.metrics = NullMetrics()
+
+        # normalized query -> timestamp, least recently used first
+        self.negative = OrderedDict()
+        self.negative_max_age = int(negative_max_age)
+        self.max_negative_entries = int(max_negative_entries)
 
-    def _is_valid(self, id_):
-        if self.id_to_timestamp.get(id_):
-            return (time.time() - self.id_to_timestamp[id_]) < self.max_cache_age
+    def __len__(self):
+        return len(self.cache)
+
+    def _is_valid(self, key, allow_stale=False):
+        timestamp = self.id_to_timestamp.get(key)
+        if timestamp:
+            return (time.time() - timestamp) < self._max_age(allow_stale)
         else:
             return False
 
-    def get_item_by_name(self, name):
+    def _max_age(self, allow_stale=False):
+        return self.max_cache_age + self.stale_grace if allow_stale else self.max_cache_age
+
+    def retention(self):
         """
-        Finds item by name, returns None if not found
+        Seconds after which entries are removed (they're only served for _max_age)
         """
-        query = str(name).lower()
-        id_ = self.name_to_id.get(query)
+        return self.max_cache_age + max(self.stale_grace, self.revalidate_grace)
 
-        if self._is_valid(id_):
-            return self.cache.get(id_)
-        else:
+    def _is_retained(self, key):
+        timestamp = self.id_to_timestamp.get(key)
+        return timestamp is not None and (time.time() - timestamp) < self.retention()
+
+    def _get(self, key, allow_stale=False):
+        if key not in self.cache:
+            return self._load_from_storage(key, allow_stale)
+
+        if not self._is_valid(key, allow_stale):
+            # Keep items that can still be served stale or revalidated
+            if not self._is_retained(key):
+                self._remove(key)
             return None
 
-    def get_item_by_id(self, id_):
+        self.cache.move_to_end(key)
+        return self.cache[key]
+
+    def is_stale(self, item) -> bool:
         """
-        Finds item by id, returns None if not found
+        Returns True if the item is cached, but older than max_cache_age
         """
-        if self._is_valid(id_):
-            return self.cache.get(id_)
-        else:
+        key = (get_media_type(item), int(item.id))
+        return key in self.cache and not self._is_valid(key)
+
+    def _load_from_storage(self, key, allow_stale=False):
+        if self.storage is None:
+            return None
+
+        stored = self.storage.load(key)
+        if stored is None:
+            return None
+
+        item, timestamp = stored
+        age = time.time() - timestamp
+        if age >= self.retention():
             return None
 
-    def get_from_cache(self, search):
+        log.debug("Loaded {} {} from storage".format(*key))
+        self._insert(key, item, timestamp)
+
+        if age >= self._max_age(allow_stale):
+            return None
+        return item
+
+    def _remove(self, key):
+        self.cache.pop(key, None)
+        self.id_to_timestamp.pop(key, None)
+        self.total_size -= self._key_to_size.pop(key, 0)
+
+        for name in self._key_to_names.pop(key, ()):
+            if self.name_to_id.get(name) == key:
+                del self.name_to_id[name]
+
+        self.title_index.remove(key)
+
+    def _evict(self):
+        while self.cache and ((self.max_entries and len(self.cache) > self.max_entries) or
+                              (self.max_bytes and self.total_size > self.max_bytes)):
+            key = next(iter(self.cache))
+            self._remove(key)
+
+            self.metrics.inc("cache.evictions", key[0])
+            log.debug("Evicted {} {} from cache".format(*key))
+
+    def sweep(self):
+        """
+        Removes all expired entries, returns the number of removed entries
+        """
+        now = time.time()
+        self._last_sweep = now
+
+        max_age = self.retention()
+        expired = [key for key, timestamp in self.id_to_timestamp.items() if (now - timestamp) >= max_age]
+        for key in expired:
+            self._remove(key)
+            self.metrics.inc("cache.expired", key[0])
+
+        expired_negative = [query for query, timestamp in self.negative.items()
+                            if (now - timestamp) >= self.negative_max_age]
+        for query in expired_negative:
+            del self.negative[query]
+
+        if expired:
+            log.debug("Swept {} expired entries".format(len(expired)))
+
+        if self.storage is not None:
+            self.storage.sweep(max_age)
+
+        return len(expired)
+
+    def _maybe_sweep(self):
+        if self.sweep_interval is not None and (time.time() - self._last_sweep) >= self.sweep_interval:
+            self.sweep()
+
+    def get_item_by_name(self, name, allow_stale=False, fuzzy=False):
+        """
+        Finds item by name, returns None if not found
+        Similar titles only match with fuzzy=True, since they can be a different title ("Predators")
+        """
+        query = normalize_query(name)
+        key = self.name_to_id.get(query)
+
+        if key is None and self.storage is not None:
+            key = self.storage.load_key_by_name(query)
+
+        if key is None:
+            match = self.title_index.lookup(query, fuzzy=fuzzy)
+            if match is None:
+                return self._record(None, "unknown")
+
+            key, confidence = match
+            if confidence < 1:
+                self.metrics.inc("cache.fuzzy_matches", key[0])
+
+        return self._record(self._get(key, allow_stale), key[0])
+
+    def get_item_by_id(self, id_, media_type=None, allow_stale=False):
+        """
+        Finds item by id, returns None if not found
+        If media_type is not specified, all namespaces are checked
+        """
+        id_ = int(id_)
+
+        if media_type is not None:
+            return self._record(self._get((media_type, id_), allow_stale), media_type)
+
+        for type_ in MEDIA_TYPES:
+            item = self._get((type_, id_), allow_stale)
+            if item is not None:
+                return self._record(item, type_)
+
+        return self._record(None, "unknown")
+
+    def _record(self, item, media_type):
+        self.metrics.inc("cache.hits" if item is not None else "cache.misses", media_type)
+        return item
+
+    def get_from_cache(self, search, media_type=None, allow_stale=False, fuzzy=False):
         if search is None:
             return None
 
@@ -64,16 +306,193 @@ class CacheManager(metaclass=Singleton):
         try:
             int(search)
         except ValueError:
-            return self.get_item_by_name(search)
+            return self.get_item_by_name(search, allow_stale=allow_stale, fuzzy=fuzzy)
+        else:
+            return self.get_item_by_id(search, media_type=media_type, allow_stale=allow_stale)
+
+    def get_entry(self, key):
+        """
+        Returns the cached item for a (media_type, id) key, regardless of its age and without counting a hit/miss
+        """
+        return self.cache.get(key)
+
+    def get_expired(self, search, media_type=None):
+        """
+        Returns a cached item that is too old to be served, but can still be revalidated, None otherwise
+        Names only match exactly, without counting a hit/miss
+        """
+        key = self.find_key(search, media_type)
+        if key is not None and not self._is_valid(key) and self._is_retained(key):
+            return self.cache[key]
+
+        return None
+
+    def find_key(self, search, media_type=None):
+        """
+        Returns the (media_type, id) key of a cached item regardless of its age, None if not cached
+        Names only match exactly. Doesn't count a hit/miss or mark the item as recently used
+        """
+        if search is None:
+            return None
+
+        try:
+            id_ = int(search)
+        except ValueError:
+            keys = [self.name_to_id.get(normalize_query(search))]
         else:
-            return self.get_item_by_id(search)
+            keys = [(media_type, id_)] if media_type else [(a, id_) for a in MEDIA_TYPES]
+
+        for key in keys:
+            if key is not None and key in self.cache:
+                return key
+
+        return None
+
+    def expires_in(self, key):
+        """
+        Seconds until a cached (media_type, id) entry goes stale (negative if it already is), None if not cached
+        """
+        timestamp = self.id_to_timestamp.get(key)
+        if timestamp is None:
+            return None
+
+        return timestamp + self.max_cache_age - time.time()
+
+    def touch(self, item):
+        """
+        Marks a cached item as fresh again (used when revalidation shows it hasn't changed)
+        """
+        key = (get_media_type(item), int(item.id))
+        if key not in self.cache:
+            return
+
+        timestamp = time.time()
+        self.id_to_timestamp[key] = timestamp
+        self.cache.move_to_end(key)
+
+        if self.storage is not None:
+            self.storage.touch(key, timestamp)
+
+    def is_negative(self, query) -> bool:
+        """
+        Returns True if the query is known to have no results
+        """
+        query = normalize_query(query)
+        timestamp = self.negative.get(query)
+
+        if timestamp is None:
+            return False
+
+        if (time.time() - timestamp) >= self.negative_max_age:
+            del self.negative[query]
+            return False
+
+        self.negative.move_to_end(query)
+        self.metrics.inc("cache.negative_hits")
+        return True
+
+    def negative_set(self, query):
+        """
+        Remembers that a query has no results
+        """
+        query = normalize_query(query)
+
+        self.negative[query] = time.time()
+        self.negative.move_to_end(query)
+
+        while len(self.negative) > self.max_negative_entries:
+            self.negative.popitem(last=False)
+
+        log.debug("Added negative entry for {}".format(query))
+
+    def get_many_from_cache(self, searches, media_type=None, allow_stale=False) -> list:
+        """
+        Looks up multiple names/ids at once, misses are None
+        """
+        return [self.get_from_cache(search, media_type=media_type, allow_stale=allow_stale) for search in searches]
 
     def item_set(self, item):
         if not isinstance(item, TMDbType):
             raise ValueError("invalid item type: {}".format(type(item)))
 
-        self.cache[item.id] = item
-        self.name_to_id[str(item.title.lower())] = item.id
-        self.id_to_timestamp[item.id] = time.time()
+        key = (get_media_type(item), int(item.id))
+        timestamp = time.time()
+
+        names = self._insert(key, item, timestamp)
+        # Partial items can only load their details in this process
+        if self.storage is not None and not is_partial(item):
+            self.storage.store(key, item, timestamp, names)
 
         log.info("Added new {} to cache".format(type(item).__name__))
+
+        self._maybe_sweep()
+        return names
+
+    def item_restore(self, item, timestamp):
+        """
+        Adds an item loaded from elsewhere (a shared cache) with the time it was originally cached
+        """
+        key = (get_media_type(item), int(item.id))
+        if (time.time() - timestamp) >= self.retention():
+            return
+
+        self._insert(key, item, timestamp)
+
+    def _insert(self, key, item, timestamp):
+        """
+        Adds an item to the in-memory cache, returns the names it was indexed under
+        """
+        # Replacing an entry, clean up the old one first (but keep the queries that resolved to it)
+        aliases = ()
+        if key in self.cache:
+            aliases = self._key_to_names.get(key, ())
+            self._remove(key)
+
+        self.cache[key] = item
+        self.id_to_timestamp[key] = timestamp
+
+        size = approximate_size(item)
+        self._key_to_size[key] = size
+        self.total_size += size
+
+        names = []
+        title = getattr(item, "title", None) or getattr(item, "name", None)
+        if title:
+            names.append(self._add_name(key, title))
+
+        for alias in aliases:
+            if self.name_to_id.get(alias) is None:
+                self._add_name(key, alias)
+
+        self.title_index.add(key, (title, getattr(item, "original_title", None), getattr(item, "original_name", None)))
+
+        self._evict()
+        return names
+
+    def _add_name(self, key, name):
+        name = normalize_query(name)
+
+        # Name now points to this entry, detach it from the previous one
+        previous = self.name_to_id.get(name)
+        if previous is not None and previous != key:
+            self._key_to_names.get(previous, set()).discard(name)
+
+        self.name_to_id[name] = key
+        self._key_to_names.setdefault(key, set()).add(name)
+
+        # The name resolves to something now
+        self.negative.pop(name, None)
+
+        return name
+
+    def remember_query(self, query, item):
+        """
+        Remembers that a query resolved to an item, so the same query is a cache hit next time
+        """
+        key = (get_media_type(item), int(item.id))
+        if key not in self.cache:
+            return
+
+        name = self._add_name(key, query)
+        if self.storage is not None:
+            self.storage.store_names(key, (name,))
@@ -8,31 +8,119 @@ __author__ = "DefaltSimon"
 __license__ = "MIT"
 
 # General imports
+import asyncio
 import logging
+import time
+from collections import OrderedDict
+from functools import partial
 from typing import Union
 
 # Library imports
-from .connector import UrllibConnector, RequestsConnector, AioHttpConnector
-from .types import Endpoints, Movie, Person, TVShow
+from .connector import Connector, UrllibConnector, RequestsConnector, AioHttpConnector, NOT_MODIFIED
+from .ratelimit import Priority
+from .metrics import Metrics, NullMetrics
+from .types import Endpoints, Movie, Person, TVShow, reference
+from .abstract import is_partial, peek
 from .utils import instantiate_type
-from .cache_manager import CacheManager
-from .exceptions import APIException
+from .cache_manager import CacheManager, normalize_query, get_media_type
+from .cache_backend import CacheBackend, LocalCacheBackend
+from .identity_map import IdentityMap
+from .batch import Batch
+from .decoding import get_decoder
+from .pagination import Paginator
+from .discover import MOVIE_FILTERS, TV_FILTERS, MAX_PAGE, PAGE_SIZE, build_params, pages_for
+from .exceptions import APIException, HTTPException
 
 log = logging.getLogger(__name__)
 log.setLevel(logging.INFO)
 
+_DETAIL_TYPES = {
+    "movie": (Endpoints.Movie, Movie),
+    "tv": (Endpoints.TVShow, TVShow),
+    "person": (Endpoints.People, Person),
+}
+
+_SUB_RESOURCES = {type_: endpoints.SUB_RESOURCES for endpoints, type_ in _DETAIL_TYPES.values()}
+
+# Results of these endpoints don't include a media_type
+_ENDPOINT_MEDIA_TYPES = {
+    Endpoints.Search.MOVIE: "movie",
+    Endpoints.Search.TVSHOW: "tv",
+    Endpoints.Search.PEOPLE: "person",
+    Endpoints.Discover.MOVIE: "movie",
+    Endpoints.Discover.TV: "tv",
+    Endpoints.Movie.POPULAR: "movie",
+    Endpoints.TVShow.POPULAR: "tv",
+    Endpoints.People.POPULAR: "person",
+}
+
+
+# Sub-resources appended to details requests (see Endpoints.*.SUB_RESOURCES)
+SEARCH_APPENDS = ("videos", "external_ids")
+MOVIE_APPENDS = TV_APPENDS = ("videos", "external_ids", "credits")
+PERSON_APPENDS = ("external_ids", "combined_credits")
+_DEFAULT_APPENDS = {"movie": MOVIE_APPENDS, "tv": TV_APPENDS, "person": PERSON_APPENDS}
+
+
+
+def _covers(item, append) -> bool:
+    """
+    True if an item was built with (at least) the given sub-resources
+    """
+    return not set(append or ()).difference(peek(item, "_appended") or ())
+
+
+def _merge_appends(append, item) -> tuple:
+    """
+    Requested sub-resources followed by the ones a cached item already had, so refetching it doesn't lose any
+    """
+    append = tuple(append or ())
+    return append + tuple(a for a in peek(item, "_appended") or () if a not in append)
+
+
+def _default_search(page, include_adult, language, region) -> bool:
+    """
+    True for first-page searches without filters (the only ones the negative cache answers)
+    """
+    return page in (None, 1) and not include_adult and language is None and region is None
+
+
+# Seconds to wait before retrying after reference data failed to load
+REFERENCE_RETRY_DELAY = 300
+
 
 class Client:
-    def __init__(self, api_key: str, connector=None, cache_manager=None):
+    def __init__(self, api_key: str, connector=None, cache_manager=None, stale_while_revalidate=True, lazy=False,
+                 metrics=None, cache_backend=None, export_index=None, reference_max_age=604800,
+                 retry_policy=None, decoder=None, projection=False, discover_max_age=3600, query_log=None):
         self.api_key = str(api_key)
 
+        # Lazy results only build derived attributes (poster, trailer, genres, ...) when they're accessed
+        # With projection, they only keep the parts of the response their type uses
+        self.lazy = lazy
+        self.projection = projection
+
+        # When the cache has a stale_grace window, either serve stale items and refresh them in the background
+        # or revalidate them before returning (cheap when they haven't changed)
+        self.stale_while_revalidate = stale_while_revalidate
+
         # If custom, must already be an instance, not a class
-        self.cache = CacheManager() if cache_manager is None else cache_manager
+        # All cache access goes through the (async) backend, a shared backend brings its own CacheManager
+        if cache_backend is not None:
+            if not isinstance(cache_backend, CacheBackend):
+                raise TypeError("cache_backend must be a CacheBackend instance")
+            self.backend = cache_backend
+        else:
+            self.backend = LocalCacheBackend(CacheManager() if cache_manager is None else cache_manager)
+
+        self.cache = self.backend.manager
 
         if not connector:
             self.req = AioHttpConnector()
+        elif isinstance(connector, Connector):
+            self.req = connector
         else:
-            if connector == "aiohtp":
+            if connector == "aiohttp":
                 self.req = AioHttpConnector()
             elif connector == "requests":
                 self.req = RequestsConnector()
@@ -43,6 +131,282 @@ class Client:
                 log.warning("Parameter connector was not one of aiohttp/requests/urllib, instancing with connector()")
                 self.req = connector()
 
+        # Requests of this client and its cache are counted here, call client.metrics.snapshot() to read them
+        # If custom, must be a Metrics instance (NullMetrics disables collection)
+        # The CacheManager is shared by every client using it and so are its counters: clients that don't pass
+        # their own metrics use the ones the cache already reports to
+        if metrics is None:
+            metrics = self.cache.metrics if not isinstance(self.cache.metrics, NullMetrics) else Metrics()
+        self.metrics = metrics
+
+        if isinstance(self.cache.metrics, NullMetrics):
+            self.cache.metrics = self.metrics
+        elif self.cache.metrics is not self.metrics:
+            log.warning("The cache already reports to the metrics of another client, its counters won't show up here")
+
+        # Timeouts, retries and hedging of this client's requests (see resilience.RetryPolicy)
+        # None uses the connector's policy
+        self.retry_policy = retry_policy
+        # "auto", "orjson", "ujson", "json" or a callable that parses bytes (see decoding.get_decoder)
+        # None uses the connector's decoder
+        self.decode = get_decoder(decoder) if decoder is not None else None
+
+        # One instance per (media_type, id) across results, cached items and nested known_for items
+        self.identity = IdentityMap(self.cache)
+
+        # With an ExportIndex, search_multi resolves titles locally and only requests details
+        self.export_index = export_index
+
+        # Genre lists and image configuration are loaded before instantiating list results
+        # and reloaded after reference_max_age seconds (a week), None disables automatic loading
+        self.reference_max_age = reference_max_age
+        self._reference_failed = 0
+
+        # Interactive search_multi queries are counted here, the cache warmer uses them (see warmer.QueryLog)
+        self.query_log = query_log
+        self.warmer = None
+
+        # Results of discover_movies/discover_tv by filter set, least recently used first
+        self.discover_max_age = discover_max_age
+        self.max_discover_entries = 256
+        self._discover_cache = OrderedDict()
+
+        # Requests that are currently being processed, identical concurrent calls share the same future
+        self._in_flight = {}
+        # Background refreshes of stale items by (media_type, id)
+        self._refreshing = {}
+
+    async def close(self):
+        """
+        Cancels background refreshes and closes the connector and cache backend
+        """
+        if self.warmer is not None:
+            await self.warmer.stop()
+        if self.query_log is not None:
+            await self.query_log.asave()
+
+        for task in list(self._refreshing.values()):
+            task.cancel()
+        self._refreshing.clear()
+
+        await self.req.close()
+        await self.backend.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    def start_warmer(self, **kwargs):
+        """
+        Starts warming the cache in the background (see warmer.CacheWarmer for kwargs), stopped on close
+        """
+        from .warmer import CacheWarmer
+
+        if self.warmer is None:
+            self.warmer = CacheWarmer(self, query_log=kwargs.pop("query_log", self.query_log), **kwargs)
+
+        return self.warmer.start()
+
+    async def _single_flight(self, key, coro_func, *args, **kwargs):
+        """
+        Runs coro_func(*args, **kwargs) once for all concurrent callers using the same key
+        """
+        future = self._in_flight.get(key)
+
+        if future is None:
+            future = asyncio.ensure_future(coro_func(*args, **kwargs))
+            self._in_flight[key] = future
+            future.add_done_callback(lambda f: self._flight_done(key, f))
+        else:
+            log.debug("Joining in-flight request {}".format(key))
+            self.metrics.inc("requests.coalesced")
+
+        # Shield so one cancelled caller doesn't cancel the request for everyone else
+        return await asyncio.shield(future)
+
+    def _flight_done(self, key, future):
+        self._in_flight.pop(key, None)
+
+        # Every caller may have given up (cancelled) already, retrieve the error so it isn't logged as unhandled
+        if not future.cancelled():
+            future.exception()
+
+    async def _from_cache(self, search, media_type=None, load_partial=True, priority=Priority.INTERACTIVE):
+        """
+        Gets an item from cache, including stale items (which are revalidated) if the cache allows them
+        Expired items are revalidated with a conditional request, which is cheap if they haven't changed
+        Partial items get their details loaded unless load_partial is False
+        """
+        allow_stale = self.backend.stale_grace > 0
+        item = await self.backend.get(search, media_type=media_type, allow_stale=allow_stale)
+
+        if item is None:
+            expired = await self.backend.get_expired(search, media_type=media_type)
+            if expired is not None and not is_partial(expired):
+                key = ("refresh", get_media_type(expired), expired.id, priority)
+                try:
+                    item = await self._single_flight(key, self._refresh, expired, priority)
+                except HTTPException as e:
+                    log.warning("Could not revalidate {} {}: {}".format(get_media_type(expired), expired.id, e))
+
+        if item is not None and allow_stale:
+            item = await self._revalidate_if_stale(item)
+
+        if item is not None and load_partial and is_partial(item):
+            item = await item.load()
+
+        return item
+
+    async def _from_cache_many(self, searches, media_type=None, append=None) -> list:
+        # Without stale_while_revalidate stale items are misses here, they're revalidated when the batch fetches them
+        allow_stale = self.backend.stale_grace > 0 and self.stale_while_revalidate
+        items = await self.backend.get_many(searches, media_type=media_type, allow_stale=allow_stale)
+        # Partial items are fetched like misses, which loads their details
+        items = [None if item is not None and is_partial(item) else item for item in items]
+        # As are items that lack some of the requested sub-resources
+        if append:
+            items = [item if item is None or _covers(item, append) else None for item in items]
+
+        if allow_stale:
+            for item in items:
+                if item is not None and await self.backend.is_stale(item):
+                    self.metrics.inc("cache.stale_hits", get_media_type(item))
+                    self._refresh_in_background(item)
+
+        return items
+
+    async def _revalidate_if_stale(self, item):
+        """
+        Refreshes a stale item, either in the background (stale_while_revalidate) or right away
+        """
+        if not await self.backend.is_stale(item):
+            return item
+
+        self.metrics.inc("cache.stale_hits", get_media_type(item))
+
+        if not self.stale_while_revalidate:
+            key = ("refresh", get_media_type(item), item.id, Priority.INTERACTIVE)
+            return await self._single_flight(key, self._refresh, item, Priority.INTERACTIVE)
+
+        self._refresh_in_background(item)
+        return item
+
+    def _refresh_in_background(self, item):
+        key = (get_media_type(item), item.id)
+
+        # Already being refreshed
+        if key in self._refreshing:
+            return
+
+        log.info("Serving stale {} {}, refreshing in background".format(*key))
+        self.metrics.inc("cache.background_refreshes", key[0])
+
+        task = asyncio.ensure_future(self._single_flight(("refresh",) + key + (Priority.BACKGROUND,), self._refresh, item))
+        self._refreshing[key] = task
+        task.add_done_callback(lambda t: self._refresh_done(key, t))
+
+    def _refresh_done(self, key, task):
+        self._refreshing.pop(key, None)
+
+        if not task.cancelled() and task.exception() is not None:
+            log.warning("Background refresh failed: {}".format(task.exception()))
+
+    async def _refresh(self, item, priority=Priority.BACKGROUND):
+        """
+        Revalidates a cached item and replaces it in the cache if it changed
+        """
+        media_type = get_media_type(item)
+        endpoints, type_ = _DETAIL_TYPES[media_type]
+        # Keep the sub-resources it was built with
+        append = peek(item, "_appended") or (("external_ids",) if media_type == "person" else SEARCH_APPENDS)
+
+        data = await self._details(endpoints, item.id, append=append, priority=priority, conditional=True)
+
+        # Nothing changed, only renew the timestamp
+        if data is NOT_MODIFIED:
+            await self.backend.touch(item)
+            return item
+
+        if not data:
+            return None
+        data["media_type"] = media_type
+
+        result = self._build(type_, data)
+
+        # Details don't include known_for
+        if media_type == "person" and getattr(result, "known_for", None) is None:
+            result.known_for = getattr(item, "known_for", None)
+
+        await self.backend.set(result)
+        return result
+
+    async def load_reference_data(self, force=False, priority=Priority.INTERACTIVE):
+        """
+        Fetches the movie and tv genre lists and the image configuration (see types.ReferenceData),
+        which are used to resolve genre_ids of list results without requesting details
+        """
+        max_age = self.reference_max_age or 0
+        if not force and reference.timestamp and (time.time() - reference.timestamp) < max_age:
+            return reference
+
+        return await self._single_flight(("reference_data", priority), self._load_reference_data, priority)
+
+    async def _load_reference_data(self, priority=Priority.INTERACTIVE):
+        configuration, movie_genres, tv_genres = await asyncio.gather(
+            self._send_request(Endpoints.CONFIGURATION, priority=priority),
+            self._send_request(Endpoints.Genres.MOVIE, priority=priority),
+            self._send_request(Endpoints.Genres.TV, priority=priority),
+        )
+
+        reference.update_configuration(configuration)
+        reference.update_genres("movie", movie_genres)
+        reference.update_genres("tv", tv_genres)
+        reference.timestamp = time.time()
+
+        log.info("Loaded reference data")
+        return reference
+
+    async def _ensure_reference_data(self, priority=Priority.INTERACTIVE):
+        """
+        Loads reference data if needed, failures only leave genre_ids unresolved
+        """
+        if self.reference_max_age is None:
+            return
+        if (time.time() - self._reference_failed) < REFERENCE_RETRY_DELAY:
+            return
+
+        try:
+            await self.load_reference_data(priority=priority)
+        except Exception as e:
+            self._reference_failed = time.time()
+            log.warning("Could not load reference data: {}".format(e))
+
+    def _build(self, type_, data: dict):
+        """
+        Instantiates a full response, returns the known instance (updated with the response) if there is one
+        """
+        item = type_.from_response(data, lazy=self.lazy, project=self.projection)
+        # Remember which sub-resources it was built with, so cache hits can tell if they're complete
+        item._appended = tuple(name for name in _SUB_RESOURCES.get(type_, ()) if name in data)
+
+        return self.identity.register(item)
+
+    def _instantiate(self, entry: dict):
+        """
+        Instantiates a search/list entry, or returns the instance that is already known
+        """
+        item = instantiate_type(entry, lazy=self.lazy, project=self.projection)
+        return self.identity.resolve(item) if item is not None else None
+
+    def _instantiate_as(self, media_type: str, entry: dict):
+        """
+        Instantiates an entry of an endpoint whose results don't include their media_type
+        """
+        entry["media_type"] = media_type
+        return self._instantiate(entry)
+
     async def prepare_request(self, fields=None):
         # If no other fields are required, skip the procedure
         if not fields:
@@ -55,57 +419,389 @@ class Client:
         # Normalize the payload dict (remove None's)
         return {a: b for a, b in fields.items() if b is not None}
 
-    async def search_multi(self, query: str, language=None, page=None, include_adult=None, region=None, check_cache=True) -> Union[Movie, TVShow, Person, None]:
+    async def search_multi(self, query: str, language=None, page=None, include_adult=None, region=None, check_cache=True,
+                           priority=Priority.INTERACTIVE, details=True) -> Union[Movie, TVShow, Person, None]:
+        """
+        Returns the best match for a query with its details (videos and external ids)
+
+        With details=False, the result is built from the search result alone (title, overview, poster, ...)
+        without waiting for a details request. Details-only attributes (genres, imdb_id, trailer, runtime, seasons)
+        are then fetched with `await result.load()` or `await result.aget("trailer")`
+        """
         if not query:
             return None
 
+        # Only count our users' queries, not the ones the warmer sends
+        if self.query_log is not None and priority < Priority.BACKGROUND:
+            self.query_log.record(query)
+
         if check_cache:
-            query_by_name = self.cache.get_from_cache(query)
+            query_by_name = await self._from_cache(query, load_partial=details, priority=priority)
             if query_by_name:
                 log.info("Got item from cache")
                 return query_by_name
 
+            if _default_search(page, include_adult, language, region) and await self.backend.is_negative(query):
+                log.info("Query is known to have no results")
+                return None
+
+        # details=False already costs a single request, the index can't make it cheaper
+        if self.export_index is not None and details and page in (None, 1) and \
+                bool(include_adult) == self.export_index.include_adult:
+            result = await self._search_export_index(query, language, check_cache, priority)
+            if result is not None:
+                await self.backend.remember_query(query, result)
+                return result
+
+        key = ("search_multi", normalize_query(query), language, page, include_adult, region, details, check_cache,
+               priority)
+        result = await self._single_flight(key, self._search_multi, query, language, page, include_adult, region, priority,
+                                           details, check_cache)
+
+        if result is not None:
+            await self.backend.remember_query(query, result)
+
+        return result
+
+    async def _search_export_index(self, query, language=None, check_cache=True, priority=Priority.INTERACTIVE):
+        """
+        Resolves a query with the export index, skipping the search request
+        Returns None if the index doesn't know the title or its id no longer exists (the caller searches instead)
+        """
+        match = self.export_index.lookup(query)
+        if match is None:
+            self.metrics.inc("export_index.misses")
+            return None
+
+        media_type, id_ = match
+        self.metrics.inc("export_index.hits", media_type)
+        log.debug("Resolved {} to {} {} with the export index".format(query, media_type, id_))
+
+        append = ("external_ids",) if media_type == "person" else SEARCH_APPENDS
+        try:
+            result = await self._get_details(media_type, id_, append, language, True, check_cache, priority)
+        except HTTPException as e:
+            log.warning("Could not get {} {} from the export index: {}".format(media_type, id_, e))
+            result = None
+
+        # Removed since the export was made
+        if result is None:
+            self.metrics.inc("export_index.stale", media_type)
+
+        return result
+
+    async def _search_multi(self, query, language, page, include_adult, region, priority=Priority.INTERACTIVE,
+                            details=True, check_cache=True):
         endpoint = Endpoints.Search.MULTI
-        entries = await self._search_get(endpoint, query, page, instantiate_types=False, language=language, include_adult=include_adult, region=region)
+        entries = await self._search_get(endpoint, query, page, instantiate_types=False, priority=priority,
+                                         language=language, include_adult=include_adult, region=region)
 
         if not entries:
+            # Negative entries are keyed by the query alone, so only remember searches without filters
+            if _default_search(page, include_adult, language, region):
+                await self.backend.set_negative(query)
             return None
 
         first_entry = entries[0]
 
         type_ = first_entry.get("media_type")
 
+        if not details and type_ in _DETAIL_TYPES:
+            return await self._partial_from_entry(first_entry, priority)
+
+        # The result may already be cached under another name (a typo, an original title), reuse it by id
+        if check_cache and type_ in _DETAIL_TYPES:
+            append = ("external_ids",) if type_ == "person" else SEARCH_APPENDS
+            cached = await self._from_cache(first_entry.get("id"), media_type=type_, load_partial=False, priority=priority)
+            if cached is not None and not is_partial(cached) and _covers(cached, append):
+                return cached
+
         # Instantiate with additional info
         if type_ == "movie":
-            additional = await self._movie_info(first_entry.get("id"))
+            additional = await self._movie_info(first_entry.get("id"), append=SEARCH_APPENDS, priority=priority)
             if not additional:
                 raise APIException("no data")
             additional["media_type"] = "movie"
 
-            result = Movie(**additional)
+            result = self._build(Movie, additional)
 
         elif type_ == "tv":
-            additional = await self._tv_info(first_entry.get("id"))
+            additional = await self._tv_info(first_entry.get("id"), append=SEARCH_APPENDS, priority=priority)
             if not additional:
                 raise APIException("no data")
             additional["media_type"] = "tv"
 
-            result = TVShow(**additional)
+            result = self._build(TVShow, additional)
         elif type_ == "person":
-            # additional = await self._person_info(first_entry.get("id"))
-            # if not additional:
-            #     raise APIException("no data")
+            additional = await self._person_info(first_entry.get("id"), append=("external_ids",), priority=priority)
+            if not additional:
+                raise APIException("no data")
 
-            result = Person(**first_entry)
+            # Details don't include known_for, keep it from the search entry
+            first_entry.update(additional)
+            result = self._build(Person, first_entry)
         else:
             log.critical("This shouldn't happen, notify the dev!")
             return None
 
-        self.cache.item_set(result)
+        await self.backend.set(result)
 
         return result
 
-    async def _search_get(self, endpoint, query=None, page=None, instantiate_types=True, **fields) -> Union[list, dict, None]:
+    async def _partial_from_entry(self, entry: dict, priority=Priority.INTERACTIVE):
+        """
+        Builds a partial item from a search result, its details are requested when needed (see TMDbType.load)
+        """
+        media_type = entry["media_type"]
+
+        # Already known, possibly with details
+        known = self.identity.get((media_type, int(entry["id"])))
+        if known is not None:
+            return known
+
+        # So genre_ids resolve to genres without loading the details
+        await self._ensure_reference_data(priority)
+
+        _, type_ = _DETAIL_TYPES[media_type]
+        result = self._build(type_, entry)
+        result._loader = self._load_details
+
+        await self.backend.set(result)
+        return result
+
+    async def _load_details(self, item, priority=Priority.INTERACTIVE):
+        key = ("load_details", get_media_type(item), item.id, priority)
+        return await self._single_flight(key, self._fetch_details_into, item, priority)
+
+    async def _fetch_details_into(self, item, priority=Priority.INTERACTIVE):
+        """
+        Upgrades a partial item in place with its details and puts it back into the cache
+        """
+        if not is_partial(item):
+            return item
+
+        media_type = get_media_type(item)
+        endpoints, _ = _DETAIL_TYPES[media_type]
+        append = ("external_ids",) if media_type == "person" else SEARCH_APPENDS
+
+        data = await self._details(endpoints, item.id, append=append, priority=priority)
+        if not data:
+            raise APIException("no data")
+        data["media_type"] = media_type
+
+        self.metrics.inc("details.deferred_loads", media_type)
+
+        item._hydrate(data)
+        item._loader = None
+        item._appended = tuple(name for name in endpoints.SUB_RESOURCES if name in data)
+
+        self.identity.register(item)
+        await self.backend.set(item)
+        return item
+
+    def search_many(self, queries, limit=8, as_completed=False, check_cache=True, priority=Priority.INTERACTIVE,
+                    **kwargs) -> Batch:
+        """
+        Looks up multiple queries with search_multi
+        Cached results are returned immediately, at most `limit` misses are searched concurrently.
+        Await the returned Batch for a list of results or iterate over it to stream (index, result) tuples
+        """
+        queries = list(queries)
+        lookup = partial(self._from_cache_many, queries) if check_cache else None
+
+        async def fetch(index):
+            return await self.search_multi(queries[index], check_cache=check_cache, priority=priority, **kwargs)
+
+        return Batch(len(queries), fetch, lookup=lookup, limit=limit, as_completed=as_completed)
+
+    def get_many(self, ids, media_type: str, limit=8, as_completed=False, check_cache=True, priority=Priority.INTERACTIVE,
+                 **kwargs) -> Batch:
+        """
+        Gets multiple movies, tv shows or people by id (see get_movie/get_tv/get_person for kwargs)
+        Works like search_many
+        """
+        if media_type not in _DETAIL_TYPES:
+            raise ValueError("Not a valid media_type: {}".format(media_type))
+
+        ids = list(ids)
+        getter = {"movie": self.get_movie, "tv": self.get_tv, "person": self.get_person}[media_type]
+        append = kwargs.get("append", _DEFAULT_APPENDS[media_type])
+
+        lookup = partial(self._from_cache_many, ids, media_type=media_type, append=append) if check_cache else None
+
+        async def fetch(index):
+            return await getter(ids[index], check_cache=check_cache, priority=priority, **kwargs)
+
+        return Batch(len(ids), fetch, lookup=lookup, limit=limit, as_completed=as_completed)
+
+    async def discover_movies(self, count=None, pages=None, sort_by="popularity.desc", with_genres=None, without_genres=None,
+                              year: int = None, release_date_gte=None, release_date_lte=None, vote_average_gte: float = None,
+                              vote_count_gte: int = None, runtime_gte: int = None, runtime_lte: int = None,
+                              with_original_language: str = None, with_keywords=None, with_people=None, region: str = None,
+                              language: str = None, include_adult=False, limit=4, check_cache=True,
+                              priority=Priority.INTERACTIVE) -> list:
+        """
+        Movies matching the filters in TMDb's order (see discover.MOVIE_FILTERS for the API parameters)
+
+        Returns the first `count` results (one page, 20, by default) or, if `pages` (e.g. range(1, 6)) is given,
+        all results of those pages (count is ignored then).
+        Pages are requested concurrently (at most `limit` at once) and duplicates are dropped.
+        Genres can be ids or names, dates can be datetime.date or "YYYY-MM-DD"
+        """
+        filters = dict(sort_by=sort_by, with_genres=with_genres, without_genres=without_genres, year=year,
+                       release_date_gte=release_date_gte, release_date_lte=release_date_lte,
+                       vote_average_gte=vote_average_gte, vote_count_gte=vote_count_gte, runtime_gte=runtime_gte,
+                       runtime_lte=runtime_lte, with_original_language=with_original_language,
+                       with_keywords=with_keywords, with_people=with_people, region=region, language=language,
+                       include_adult=include_adult)
+
+        return await self._discover("movie", Endpoints.Discover.MOVIE, MOVIE_FILTERS, filters, count, pages, limit,
+                                    check_cache, priority)
+
+    async def discover_tv(self, count=None, pages=None, sort_by="popularity.desc", with_genres=None, without_genres=None,
+                          year: int = None, air_date_gte=None, air_date_lte=None, vote_average_gte: float = None,
+                          vote_count_gte: int = None, runtime_gte: int = None, runtime_lte: int = None,
+                          with_original_language: str = None, with_keywords=None, with_networks=None, language: str = None,
+                          include_adult=False, limit=4, check_cache=True, priority=Priority.INTERACTIVE) -> list:
+        """
+        TV shows matching the filters, works like discover_movies (see discover.TV_FILTERS)
+        """
+        filters = dict(sort_by=sort_by, with_genres=with_genres, without_genres=without_genres, year=year,
+                       air_date_gte=air_date_gte, air_date_lte=air_date_lte, vote_average_gte=vote_average_gte,
+                       vote_count_gte=vote_count_gte, runtime_gte=runtime_gte, runtime_lte=runtime_lte,
+                       with_original_language=with_original_language, with_keywords=with_keywords,
+                       with_networks=with_networks, language=language, include_adult=include_adult)
+
+        return await self._discover("tv", Endpoints.Discover.TV, TV_FILTERS, filters, count, pages, limit,
+                                    check_cache, priority)
+
+    async def _discover(self, media_type, endpoint, names, filters, count, pages, limit, check_cache, priority):
+        # Explicit pages are returned in full
+        if pages is not None:
+            count = None
+        elif count is None:
+            count = PAGE_SIZE
+
+        await self._ensure_reference_data(priority)
+        genres = {name.lower(): id_ for id_, name in reference.genres[media_type].items()}
+        params = build_params(filters, names, genres)
+
+        pages = tuple(sorted(set(pages))) if pages is not None else None
+        key = (media_type, tuple(sorted(params.items())), pages)
+
+        if check_cache:
+            cached = self._discover_cache.get(key)
+            if cached is not None:
+                timestamp, results, exhausted = cached
+
+                # Results of a bigger count can serve smaller ones
+                fresh = (time.time() - timestamp) < self.discover_max_age
+                if fresh and (pages is not None or exhausted or len(results) >= count):
+                    self._discover_cache.move_to_end(key)
+                    self.metrics.inc("discover.cache_hits", media_type)
+                    return results[:count] if count is not None else list(results)
+
+        results, exhausted = await self._single_flight(("discover",) + key + (count, priority), self._discover_pages,
+                                                       endpoint, media_type, params, count, pages, limit, priority)
+
+        self._discover_cache[key] = (time.time(), results, exhausted)
+        self._discover_cache.move_to_end(key)
+        while len(self._discover_cache) > self.max_discover_entries:
+            self._discover_cache.popitem(last=False)
+
+        return results[:count] if count is not None else list(results)
+
+    async def _discover_pages(self, endpoint, media_type, params, count, pages, limit, priority):
+        """
+        Requests pages concurrently and merges their results in order, returns (results, whether there are no more)
+        """
+        limit = max(1, int(limit))
+        semaphore = asyncio.Semaphore(limit)
+
+        async def fetch_page(page):
+            async with semaphore:
+                return await self._send_request(endpoint, dict(params, page=page), priority=priority)
+
+        seen = set()
+        results = []
+        total_pages = None
+        exhausted = False
+
+        to_fetch = list(pages) if pages is not None else list(pages_for(count))
+        while to_fetch:
+            # Until total_pages is known only send the first wave (the rest would wait for the semaphore anyway),
+            # so pages past the end aren't requested
+            remaining = []
+            if total_pages is None and len(to_fetch) > limit:
+                to_fetch, remaining = to_fetch[:limit], to_fetch[limit:]
+
+            self.metrics.inc("discover.pages", media_type, len(to_fetch))
+            responses = await asyncio.gather(*[fetch_page(page) for page in to_fetch])
+
+            for resp in responses:
+                if not resp:
+                    continue
+
+                total_pages = resp.get("total_pages", total_pages)
+                for entry in resp.get("results") or []:
+                    if entry.get("id") in seen:
+                        continue
+                    seen.add(entry.get("id"))
+
+                    entry["media_type"] = media_type
+                    item = self._instantiate(entry)
+                    if item is not None:
+                        results.append(item)
+
+            last_page = min(MAX_PAGE, total_pages or 0)
+            remaining = [page for page in remaining if page <= last_page]
+            if remaining:
+                to_fetch = remaining
+                continue
+
+            exhausted = to_fetch[-1] >= last_page
+            if pages is not None or exhausted or len(results) >= count:
+                break
+
+            # Duplicates across pages left us short, request as many pages as are missing
+            to_fetch = [page for page in pages_for(count - len(results), to_fetch[-1] + 1) if page <= last_page]
+
+        return results, exhausted
+
+    def paginate(self, endpoint: str, query: str = None, start_page=1, max_pages=None, prefetch=True, instantiate_types=True,
+                 priority=Priority.INTERACTIVE, **fields) -> Paginator:
+        """
+        Iterates over all results of a paginated endpoint (Endpoints.Search.* or Endpoints.Discover.*):
+
+            async for movie in client.paginate(Endpoints.Discover.MOVIE, sort_by="popularity.desc", max_pages=5):
+                ...
+
+        Results are instantiated as Movie, TVShow or Person where possible, other endpoints
+        (keywords, companies, collections) yield dicts
+        """
+        payload = {"query": query}
+        payload.update(fields)
+
+        async def fetch_page(page):
+            if instantiate_types:
+                await self._ensure_reference_data(priority)
+            return await self._send_request(endpoint, dict(payload, page=page), priority=priority)
+
+        media_type = _ENDPOINT_MEDIA_TYPES.get(endpoint)
+
+        if not instantiate_types:
+            instantiate = None
+        elif media_type is not None:
+            instantiate = partial(self._instantiate_as, media_type)
+        elif endpoint == Endpoints.Search.MULTI:
+            instantiate = self._instantiate
+        else:
+            instantiate = None
+
+        return Paginator(fetch_page, instantiate, start_page=start_page, max_pages=max_pages, prefetch=prefetch)
+
+    async def _search_get(self, endpoint, query=None, page=None, instantiate_types=True, priority=Priority.INTERACTIVE,
+                          **fields) -> Union[list, dict, None]:
         payload = {
             "query": query,
             "page": page,
@@ -114,7 +810,7 @@ class Client:
         for name, value in fields.items():
             payload[name] = value
 
-        resp = await self._send_request(endpoint, payload)
+        resp = await self._send_request(endpoint, payload, priority=priority)
 
         if not resp:
             return None
@@ -124,9 +820,11 @@ class Client:
 
         # Only instantiate if specified
         if instantiate_types:
+            await self._ensure_reference_data(priority)
+
             res = []
             for entry in results:
-                instance = instantiate_type(entry)
+                instance = self._instantiate(entry)
                 if instance:
                     res.append(instance)
 
@@ -135,18 +833,99 @@ class Client:
         else:
             return results
 
-    async def _movie_info(self, id_: int):
-        endpoint = Endpoints.Movie.DETAILS.format(id=id_)
-        return await self._send_request(endpoint)
+    async def get_movie(self, id_: int, append=MOVIE_APPENDS, language=None, combine=True, check_cache=True,
+                        priority=Priority.INTERACTIVE) -> Union[Movie, None]:
+        """
+        Gets a fully populated Movie (details, videos, external ids and credits by default)
+        """
+        return await self._get_details("movie", id_, append, language, combine, check_cache, priority)
+
+    async def get_tv(self, id_: int, append=TV_APPENDS, language=None, combine=True, check_cache=True,
+                        priority=Priority.INTERACTIVE) -> Union[TVShow, None]:
+        """
+        Gets a fully populated TVShow (details, videos, external ids and credits by default)
+        """
+        return await self._get_details("tv", id_, append, language, combine, check_cache, priority)
+
+    async def get_person(self, id_: int, append=PERSON_APPENDS, language=None, combine=True, check_cache=True,
+                        priority=Priority.INTERACTIVE) -> Union[Person, None]:
+        """
+        Gets a fully populated Person (details, external ids and combined credits by default)
+        """
+        return await self._get_details("person", id_, append, language, combine, check_cache, priority)
+
+    async def _get_details(self, media_type, id_, append, language, combine, check_cache, priority=Priority.INTERACTIVE):
+        if check_cache:
+            item = await self._from_cache(id_, media_type=media_type, load_partial=False, priority=priority)
+            if item and _covers(item, append):
+                log.info("Got item from cache")
+                return item
+
+            # Cached without some of the requested sub-resources
+            if item:
+                append = _merge_appends(append, item)
+
+        endpoints, type_ = _DETAIL_TYPES[media_type]
+
+        data = await self._details(endpoints, id_, append=append, combine=combine, priority=priority, language=language)
+        if not data:
+            return None
+        data["media_type"] = media_type
+
+        result = self._build(type_, data)
+        await self.backend.set(result)
+
+        return result
+
+    async def _details(self, endpoints, id_: int, append=None, combine=True, priority=Priority.INTERACTIVE,
+                       conditional=False, **fields):
+        """
+        Requests details along with sub-resources
+        With combine, everything is fetched in one round trip using append_to_response,
+        otherwise the sub-resources are requested concurrently from their own endpoints.
+        conditional only applies to single requests (may return NOT_MODIFIED)
+        """
+        endpoint = endpoints.DETAILS.format(id=id_)
+
+        if not append:
+            return await self._send_request(endpoint, fields, priority=priority, conditional=conditional)
+
+        if combine:
+            fields["append_to_response"] = ",".join(append)
+            return await self._send_request(endpoint, fields, priority=priority, conditional=conditional)
+
+        try:
+            sub_endpoints = [endpoints.SUB_RESOURCES[name].format(id=id_) for name in append]
+        except KeyError as e:
+            raise ValueError("unknown sub-resource: {}".format(e.args[0]))
+
+        responses = await asyncio.gather(
+            self._send_request(endpoint, dict(fields), priority=priority),
+            *[self._send_request(sub, dict(fields), priority=priority) for sub in sub_endpoints]
+        )
+
+        details = responses[0]
+        if not details:
+            return None
 
-    async def _person_info(self, id_: int):
-        endpoint = Endpoints.People.DETAILS.format(id=id_)
-        return await self._send_request(endpoint)
+        for name, sub in zip(append, responses[1:]):
+            details[name] = sub
 
-    async def _tv_info(self, id_: int):
-        endpoint = Endpoints.TVShow.DETAILS.format(id=id_)
-        return await self._send_request(endpoint)
+        return details
 
-    async def _send_request(self, endpoint, payload=None):
+    async def _movie_info(self, id_: int, append=None, priority=Priority.INTERACTIVE):
+        return await self._details(Endpoints.Movie, id_, append=append, priority=priority)
+
+    async def _person_info(self, id_: int, append=None, priority=Priority.INTERACTIVE):
+        return await self._details(Endpoints.People, id_, append=append, priority=priority)
+
+    async def _tv_info(self, id_: int, append=None, priority=Priority.INTERACTIVE):
+        return await self._details(Endpoints.TVShow, id_, append=append, priority=priority)
+
+    async def _send_request(self, endpoint, payload=None, priority=Priority.INTERACTIVE, conditional=False):
         payload = await self.prepare_request(payload)
-        return await self.req.request(endpoint, payload)
+
+        # Flights are per priority, so an interactive caller never waits in the limiter behind a background flight
+        key = (endpoint, tuple(sorted(payload.items())), conditional, priority)
+        return await self._single_flight(key, self.req.request, endpoint, payload, priority=priority, conditional=conditional,
+                                         metrics=self.metrics, policy=self.retry_policy, decode=self.decode)
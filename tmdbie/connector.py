@@ -5,28 +5,69 @@ Connector part for TMDbie
 
 # 3rd party
 import importlib
+import importlib.util
 import logging
-import time
 import asyncio
-from urllib.parse import quote_plus
+import gzip
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote_plus, urlsplit
 
 # Lib imports
 from .exceptions import HTTPException, DecodeError, RatelimitException
+from .ratelimit import RateLimiter, Priority
+from .metrics import NullMetrics, endpoint_family
+from .resilience import RetryPolicy
+from .decoding import get_decoder
 from .utils import Singleton
 
 log = logging.getLogger(__name__)
 
-# ujson is blazing fast, but fall back to standard json if not installed
-try:
-    from ujson import loads
-except ImportError:
-    log.warning("ujson not installed, falling back to standard json lib")
-    from json import loads
+# Returned by conditional requests when the cached response is still valid
+NOT_MODIFIED = object()
 
 
 class Connector:
-    def __init__(self):
-        pass
+    """
+    Base connector, subclasses only implement _fetch (and close if they hold resources)
+
+    Validators (ETag and Last-Modified) of successful responses are remembered per url, so requests
+    with conditional=True can be answered with 304 Not Modified (returned as NOT_MODIFIED).
+
+    Connectors can be used as async context managers, which closes them on exit.
+    Closed connectors open new sessions/connections on the next request.
+
+    Timeouts, retries and hedging are configured with policy (see resilience.RetryPolicy),
+    which requests can override (connectors are shared, clients pass their own).
+    Response bodies are parsed straight from bytes with decoder (see decoding.get_decoder),
+    requests can pass their own decode function instead
+    """
+    def __init__(self, rate_limiter=None, max_validators=4096, policy=None, decoder="auto"):
+        # Shared by everything that goes through this connector
+        self.limiter = RateLimiter() if rate_limiter is None else rate_limiter
+        self.policy = RetryPolicy() if policy is None else policy
+
+        # Resolved on the first response, so importing doesn't load any json library
+        self.decoder = decoder
+        self._decode = None
+
+        # formatted url -> (etag, last_modified)
+        self.validators = OrderedDict()
+        self.max_validators = int(max_validators)
+
+        # Used by requests that don't pass their own metrics (clients pass theirs, connectors are shared)
+        self.metrics = NullMetrics()
+
+    def set_decoder(self, decoder):
+        self.decoder = decoder
+        self._decode = None
+
+    def _decoder(self):
+        if self._decode is None:
+            self._decode = get_decoder(self.decoder)
+        return self._decode
 
     @staticmethod
     def _build_url(url: str, **fields) -> str:
@@ -40,12 +81,210 @@ class Connector:
 
         return str(url) + "&".join(field_list)
 
+    def _conditional_headers(self, url: str) -> dict:
+        validators = self.validators.get(url)
+        if not validators:
+            return {}
+
+        etag, last_modified = validators
+        headers = {}
+        if etag:
+            headers["If-None-Match"] = etag
+        if last_modified:
+            headers["If-Modified-Since"] = last_modified
+
+        return headers
+
+    def _store_validators(self, url: str, headers):
+        etag = headers.get("ETag")
+        last_modified = headers.get("Last-Modified")
+
+        if not etag and not last_modified:
+            return
+
+        self.validators[url] = (etag, last_modified)
+        self.validators.move_to_end(url)
+
+        while len(self.validators) > self.max_validators:
+            self.validators.popitem(last=False)
+
+    async def _fetch(self, url: str, headers: dict, policy: RetryPolicy):
+        """
+        Sends a GET request with the policy's timeouts, returns (status, headers, body)
+        """
+        raise NotImplementedError
+
+    async def close(self):
+        pass
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    def _is_retryable(self, exc) -> bool:
+        """
+        Returns True for errors worth retrying (timeouts, connection problems), subclasses add their library's errors
+        """
+        return isinstance(exc, (asyncio.TimeoutError, OSError))
+
+    async def _attempt(self, url: str, headers: dict, priority, family: str, metrics, policy):
+        """
+        Sends a single (possibly hedged) request, returns (status, headers, body)
+        """
+        # Wait for our turn instead of running into 429s
+        await self.limiter.acquire(priority)
+        log.debug("Sending request to {}".format(url))
+
+        metrics.add_gauge("requests.in_flight", 1)
+        started = time.monotonic()
+        try:
+            status, resp_headers, body = await self._fetch_hedged(url, headers, family, metrics, policy)
+        except Exception:
+            metrics.inc("requests.errors", family)
+            raise
+        finally:
+            metrics.add_gauge("requests.in_flight", -1)
+
+        elapsed = time.monotonic() - started
+        metrics.observe("requests.latency", elapsed, family)
+        metrics.inc("requests", family)
+
+        if 200 <= status < 400:
+            policy.record_latency(family, elapsed)
+
+        self.limiter.update(resp_headers)
+        if self.limiter.remaining is not None:
+            metrics.set_gauge("ratelimit.remaining", self.limiter.remaining)
+
+        return status, resp_headers, body
+
+    async def _fetch_hedged(self, url: str, headers: dict, family: str, metrics, policy):
+        """
+        Sends a duplicate request if the first one is slower than usual and returns whichever finishes first
+        """
+        delay = policy.hedge_delay(family)
+        if delay is None:
+            return await self._fetch(url, headers, policy)
+
+        tasks = [asyncio.ensure_future(self._fetch(url, headers, policy))]
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+
+            # Only hedge if the rate limit budget allows it
+            if not done and self.limiter.try_acquire(policy.hedge_reserve):
+                log.debug("Hedging request to {} after {:.3f}s".format(url, delay))
+                metrics.inc("requests.hedged", family)
+                tasks.append(asyncio.ensure_future(self._fetch(url, headers, policy)))
+
+            pending = set(tasks)
+            error = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is not tasks[0]:
+                            metrics.inc("requests.hedge_wins", family)
+                        return task.result()
+                    error = error or task.exception()
+
+            raise error
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    async def request(self, url, fields: dict, priority=Priority.DEFAULT, conditional=False, exit_on_ratelimit=False,
+                      metrics=None, policy=None, decode=None):
+        # Make a valid url with all the provided fields
+        formatted_url = self._build_url(url, **fields)
+        headers = self._conditional_headers(formatted_url) if conditional else {}
+
+        family = endpoint_family(url)
+        metrics = self.metrics if metrics is None else metrics
+        policy = self.policy if policy is None else policy
+
+        attempt = 0
+        while True:
+            try:
+                status, resp_headers, body = await self._attempt(formatted_url, headers, priority, family, metrics, policy)
+            except Exception as e:
+                if attempt >= policy.max_retries or not self._is_retryable(e):
+                    raise
+
+                delay = policy.backoff(attempt)
+                attempt += 1
+
+                log.warning("Request failed ({}), retrying in {:.2f}s".format(type(e).__name__, delay))
+                metrics.inc("requests.retries", family)
+                await asyncio.sleep(delay)
+                continue
+
+            # Check if everything is ok
+            if status == 429:
+                metrics.inc("requests.ratelimited", family)
+
+                try:
+                    retry_after = float(resp_headers.get("Retry-After", 1))
+                except ValueError:
+                    retry_after = 1.0
+
+                # Hold back every other request as well
+                self.limiter.block_for(retry_after)
+
+                # Prevent infinite loops
+                if exit_on_ratelimit:
+                    raise RatelimitException("reached the ratelimit one too many times, try again in {}".format(retry_after))
+
+                log.warning("Bucket is exhausted, retrying in {}".format(retry_after))
+                metrics.inc("requests.retries", family)
+                exit_on_ratelimit = True
+                continue
+
+            if status in policy.retry_statuses and attempt < policy.max_retries:
+                delay = policy.backoff(attempt)
+                attempt += 1
+
+                log.warning("Got status code {}, retrying in {:.2f}s".format(status, delay))
+                metrics.inc("requests.retries", family)
+                await asyncio.sleep(delay)
+                continue
+
+            break
+
+        if status == 304:
+            log.debug("Not modified: {}".format(formatted_url))
+            metrics.inc("requests.not_modified", family)
+            return NOT_MODIFIED
+
+        if not (200 <= status < 300):
+            metrics.inc("requests.errors", family)
+            raise HTTPException("Got status code {}".format(status))
+
+        if not body:
+            raise DecodeError("empty response")
+
+        if decode is None:
+            decode = self._decoder()
+        try:
+            json_data = decode(body)
+        except Exception:
+            log.debug("Malformed data: {}".format(body))
+            raise DecodeError("malformed json data")
+
+        if not json_data:
+            raise DecodeError("empty response")
+
+        self._store_validators(formatted_url, resp_headers)
+        return json_data
+
     @classmethod
     def get_urllib(cls):
         return UrllibConnector()
 
     @classmethod
-    def get_aiohttp(cls, loop=asyncio.get_event_loop()):
+    def get_aiohttp(cls, loop=None):
         return AioHttpConnector(loop)
 
     @classmethod
@@ -53,35 +292,123 @@ class Connector:
         return RequestsConnector()
 
 
-class UrllibConnector(Connector, metaclass=Singleton):
-    def __init__(self):
+class ThreadedConnector(Connector):
+    """
+    Base for connectors built on blocking libraries
+
+    Requests are run in a thread pool so they don't block the event loop,
+    subclasses implement _fetch_blocking instead of _fetch
+    """
+    def __init__(self, executor=None, max_workers=8):
         super().__init__()
 
+        self.max_workers = int(max_workers)
+        # If custom, must be a concurrent.futures.Executor (it's not shut down on close)
+        # The default one is created on the first request
+        self.executor = executor
+        self._own_executor = None
+
+    def _get_executor(self):
+        if self.executor is not None:
+            return self.executor
+
+        if self._own_executor is None:
+            self._own_executor = ThreadPoolExecutor(self.max_workers)
+        return self._own_executor
+
+    async def _fetch(self, url: str, headers: dict, policy: RetryPolicy):
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(self._get_executor(), self._fetch_blocking, url, headers, policy)
+
+    def _fetch_blocking(self, url: str, headers: dict, policy: RetryPolicy):
+        raise NotImplementedError
+
+    async def close(self):
+        if self._own_executor is not None:
+            self._own_executor.shutdown(wait=False)
+            self._own_executor = None
+
+
+class UrllibConnector(ThreadedConnector, metaclass=Singleton):
+    """
+    Standard library connector, every worker thread keeps its own keep-alive connection per host
+    """
+    def __init__(self, executor=None, max_workers=8):
+        super().__init__(executor, max_workers)
+
         # Included in the standard library
-        self.urllib = importlib.import_module("urllib")
+        self.http = importlib.import_module("http.client")
 
-    def request(self, url, fields: dict) -> dict:
-        # Make a valid url with all the provided fields
-        formatted_url = self._build_url(url, **fields)
-        log.debug("Requesting json from {}".format(formatted_url))
+        self._local = threading.local()
+        # Connections of all threads, so they can be closed
+        self._all_connections = []
+        self._connections_lock = threading.Lock()
 
-        with self.urllib.urlopen(formatted_url) as data:
-            data = data.read()
+    def _connection(self, scheme: str, host: str):
+        connections = getattr(self._local, "connections", None)
+        if connections is None:
+            connections = self._local.connections = {}
 
-        assert data is not None
+        conn = connections.get((scheme, host))
+        if conn is None:
+            conn_type = self.http.HTTPSConnection if scheme == "https" else self.http.HTTPConnection
+            conn = connections[(scheme, host)] = conn_type(host)
 
-        try:
-            json = loads(data)
-        except Exception:
-            log.debug("Malformed data: {}".format(data))
-            raise DecodeError("malformed json data")
+            with self._connections_lock:
+                self._all_connections.append(conn)
 
-        return json
+        return conn
 
+    def _is_retryable(self, exc) -> bool:
+        return super()._is_retryable(exc) or isinstance(exc, self.http.HTTPException)
 
-class RequestsConnector(Connector, metaclass=Singleton):
-    def __init__(self):
-        super().__init__()
+    async def close(self):
+        await super().close()
+
+        with self._connections_lock:
+            connections, self._all_connections = self._all_connections, []
+
+        # Closed connections reconnect on their next request
+        for conn in connections:
+            conn.close()
+
+    def _fetch_blocking(self, url: str, headers: dict, policy: RetryPolicy):
+        parts = urlsplit(url)
+        path = parts.path + ("?" + parts.query if parts.query else "")
+
+        headers = dict(headers)
+        headers["Accept-Encoding"] = "gzip"
+
+        # A kept-alive connection may have been closed by the server in the meantime, retry once on a new one
+        for attempt in range(2):
+            conn = self._connection(parts.scheme, parts.netloc)
+            try:
+                if conn.sock is None:
+                    conn.timeout = policy.connect_timeout
+                    conn.connect()
+                conn.sock.settimeout(policy.read_timeout)
+
+                conn.request("GET", path, headers=headers)
+                resp = conn.getresponse()
+                body = resp.read()
+                break
+            except (self.http.HTTPException, ConnectionError):
+                conn.close()
+                if attempt:
+                    raise
+
+        if resp.getheader("Content-Encoding") == "gzip":
+            body = gzip.decompress(body)
+
+        return resp.status, resp.headers, body
+
+
+class RequestsConnector(ThreadedConnector, metaclass=Singleton):
+    """
+    Uses a pooled requests.Session (keep-alive, gzip)
+    """
+    def __init__(self, executor=None, max_workers=8):
+        super().__init__(executor, max_workers)
 
         try:
             self.req = importlib.import_module("requests")
@@ -89,67 +416,95 @@ class RequestsConnector(Connector, metaclass=Singleton):
             log.critical("Could not import requests")
             raise ImportError("module requests not found")
 
-    def request(self, url, fields: dict) -> dict:
-        # Make a valid url with all the provided fields
-        formatted_url = self._build_url(url, **fields)
-        log.debug("Requesting json from {}".format(formatted_url))
+        self.session = self.req.Session()
 
-        resp = self.req.get(formatted_url)
+        # One pooled connection per worker
+        adapter = self.req.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=self.max_workers)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
 
-        # Notify if something goes wrong
-        if resp.status_code != self.req.codes.ok:
-            resp.raise_for_status()
+    def _fetch_blocking(self, url: str, headers: dict, policy: RetryPolicy):
+        resp = self.session.get(url, headers=headers, timeout=(policy.connect_timeout, policy.read_timeout))
+        return resp.status_code, resp.headers, resp.content
 
-        if not resp.text:
-            raise DecodeError("empty response")
+    def _is_retryable(self, exc) -> bool:
+        return super()._is_retryable(exc) or isinstance(exc, (self.req.ConnectionError, self.req.Timeout))
 
-        return loads(resp.text)
+    async def close(self):
+        await super().close()
+        # Only closes the pooled connections, the session can still be used
+        self.session.close()
 
 
 class AioHttpConnector(Connector, metaclass=Singleton):
-    def __init__(self, loop=asyncio.get_event_loop()):
+    """
+    Uses an aiohttp.ClientSession, which is created on the first request in the running loop
+    (and replaced if the connector is later used from a different loop)
+    """
+    def __init__(self, loop=None):
         super().__init__()
 
-        try:
-            self.aio = importlib.import_module("aiohttp")
-        except ImportError:
+        # Only check that aiohttp is there, importing it is slow
+        if importlib.util.find_spec("aiohttp") is None:
             log.critical("Could not import aiohttp")
             raise ImportError("module aiohttp not found")
 
-        self.session = self.aio.ClientSession(loop=loop)
+        # Unused, sessions are bound to the loop they're created in
+        self.loop = loop
 
-    async def request(self, url, fields: dict, exit_on_ratelimit=False) -> dict:
-        # Make a valid url with all the provided fields
-        formatted_url = self._build_url(url, **fields)
-        log.debug("Sending request to {}".format(formatted_url))
+        self.aio = None
+        self.session = None
+        self._session_loop = None
 
-        # Send GET request
-        async with self.session.get(formatted_url) as resp:
-            log.debug("X-Ratelimit-Remaining is {}".format(resp.headers.get("X-Ratelimit-Remaining")))
-            # Check if everything is ok
-            if resp.status == 429:
-                retry_after = resp.headers.get("Retry-After")
-                time_delta = time.time() - int(retry_after)
+    def _get_session(self):
+        loop = asyncio.get_event_loop()
 
-                # Prevent infinite loops
-                if exit_on_ratelimit:
-                    raise RatelimitException("reached the ratelimit one too many times, try again in {}".format(time_delta))
+        if self.session is None or self.session.closed or self._session_loop is not loop:
+            if self.aio is None:
+                self.aio = importlib.import_module("aiohttp")
+
+            self._discard_session()
+            self.session = self.aio.ClientSession()
+            self._session_loop = loop
 
-                # If timer is not up, wait
-                if not (time_delta <= 0):
-                    log.warning("Bucket is exhausted, retrying in {}".format(time_delta))
-                    await asyncio.sleep(time_delta)
+        return self.session
 
-                log.warning("Retrying request to tmdb")
-                return await self.request(url, fields, exit_on_ratelimit=True)
+    def _discard_session(self):
+        """
+        Closes a session created in another loop, which can't be awaited from this one
+        """
+        session, loop = self.session, self._session_loop
+        self.session = None
+
+        if session is None or session.closed:
+            return
+
+        if loop is not None and loop.is_running():
+            # Still running in another thread, close it there
+            asyncio.run_coroutine_threadsafe(session.close(), loop)
+            return
+
+        # Closing the connector closes its connections right away and marks the session as closed
+        try:
+            session.connector.close()
+        except RuntimeError as e:
+            # The session's loop is already closed, so are its connections
+            log.debug("Could not close the previous session: {}".format(e))
+
+    async def _fetch(self, url: str, headers: dict, policy: RetryPolicy):
+        # Send GET request
+        session = self._get_session()
+        timeout = self.aio.ClientTimeout(sock_connect=policy.connect_timeout, sock_read=policy.read_timeout)
 
-            if not (200 <= resp.status < 300):
-                raise HTTPException("Got status code {}".format(resp.status))
+        async with session.get(url, headers=headers, timeout=timeout) as resp:
+            return resp.status, resp.headers, await resp.read()
 
-            # Use custom lib for json parsing
-            json_data = await resp.json(loads=loads)
+    def _is_retryable(self, exc) -> bool:
+        return super()._is_retryable(exc) or (self.aio is not None and isinstance(exc, self.aio.ClientError))
 
-            if not json_data:
-                raise DecodeError("empty response")
+    async def close(self):
+        session, self.session = self.session, None
+        self._session_loop = None
 
-            return json_data
+        if session is not None and not session.closed:
+            await session.close()
@@ -0,0 +1,47 @@
+# coding=utf-8
+"""
+JSON decoders for TMDbie
+"""
+import importlib
+import json
+import logging
+
+log = logging.getLogger(__name__)
+log.setLevel(logging.INFO)
+
+# Tried in this order with decoder="auto"
+DECODERS = ("orjson", "ujson", "json")
+
+
+def _json_loads(body):
+    # Older versions of the standard json module don't accept bytes
+    if isinstance(body, (bytes, bytearray)):
+        body = body.decode("utf-8")
+    return json.loads(body)
+
+
+def get_decoder(decoder="auto"):
+    """
+    Returns a function that parses a response body (bytes) into python objects
+
+    decoder is "auto" (the fastest installed one), "orjson", "ujson", "json" or a callable
+    """
+    if callable(decoder):
+        return decoder
+
+    if decoder != "auto" and decoder not in DECODERS:
+        raise ValueError("Not a valid decoder: {}".format(decoder))
+
+    for name in (DECODERS if decoder == "auto" else (decoder,)):
+        if name == "json":
+            return _json_loads
+
+        try:
+            module = importlib.import_module(name)
+        except ImportError:
+            if decoder != "auto":
+                raise ImportError("module {} not found".format(name))
+            continue
+
+        log.debug("Decoding responses with {}".format(name))
+        return module.loads
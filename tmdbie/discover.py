@@ -0,0 +1,105 @@
+# coding=utf-8
+"""
+Filters for the discover endpoints
+"""
+import datetime
+import logging
+
+log = logging.getLogger(__name__)
+log.setLevel(logging.INFO)
+
+# TMDb returns 20 results per page and no pages after 500
+PAGE_SIZE = 20
+MAX_PAGE = 500
+
+# Client.discover_* argument -> API parameter
+MOVIE_FILTERS = {
+    "sort_by": "sort_by",
+    "with_genres": "with_genres",
+    "without_genres": "without_genres",
+    "year": "primary_release_year",
+    "release_date_gte": "primary_release_date.gte",
+    "release_date_lte": "primary_release_date.lte",
+    "vote_average_gte": "vote_average.gte",
+    "vote_count_gte": "vote_count.gte",
+    "runtime_gte": "with_runtime.gte",
+    "runtime_lte": "with_runtime.lte",
+    "with_original_language": "with_original_language",
+    "with_keywords": "with_keywords",
+    "with_people": "with_people",
+    "region": "region",
+    "language": "language",
+    "include_adult": "include_adult",
+}
+
+TV_FILTERS = {
+    "sort_by": "sort_by",
+    "with_genres": "with_genres",
+    "without_genres": "without_genres",
+    "year": "first_air_date_year",
+    "air_date_gte": "first_air_date.gte",
+    "air_date_lte": "first_air_date.lte",
+    "vote_average_gte": "vote_average.gte",
+    "vote_count_gte": "vote_count.gte",
+    "runtime_gte": "with_runtime.gte",
+    "runtime_lte": "with_runtime.lte",
+    "with_original_language": "with_original_language",
+    "with_keywords": "with_keywords",
+    "with_networks": "with_networks",
+    "language": "language",
+    "include_adult": "include_adult",
+}
+
+_GENRE_FILTERS = ("with_genres", "without_genres")
+
+
+def format_value(value):
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.strftime("%Y-%m-%d")
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return ",".join(str(format_value(a)) for a in value)
+
+    return value
+
+
+def build_params(filters: dict, names: dict, genres: dict = None) -> dict:
+    """
+    Converts discover arguments to API parameters, genres can be given by name if genres (name -> id) is known
+    """
+    params = {}
+    for name, value in filters.items():
+        if value is None:
+            continue
+
+        param = names.get(name)
+        if param is None:
+            raise TypeError("unknown discover filter: {}".format(name))
+
+        if name in _GENRE_FILTERS:
+            value = [value] if isinstance(value, (str, int)) else list(value)
+            value = [_genre_id(a, genres) for a in value]
+
+        params[param] = format_value(value)
+
+    return params
+
+
+def _genre_id(genre, genres):
+    if isinstance(genre, int) or str(genre).isdigit():
+        return int(genre)
+
+    genre_id = (genres or {}).get(str(genre).lower())
+    if genre_id is None:
+        raise ValueError("unknown genre: {}".format(genre))
+
+    return genre_id
+
+
+def pages_for(count: int, start_page=1) -> range:
+    """
+    Pages needed for count results
+    """
+    end = min(MAX_PAGE, start_page + max(1, -(-int(count) // PAGE_SIZE)) - 1)
+    return range(start_page, end + 1)
@@ -0,0 +1,144 @@
+# coding=utf-8
+"""
+Offline title index built from the TMDb daily ID exports
+"""
+import gzip
+import json
+import logging
+import os
+from array import array
+
+from .title_index import canonical_title
+
+log = logging.getLogger(__name__)
+log.setLevel(logging.INFO)
+
+MEDIA_TYPE_CODES = ("movie", "tv", "person")
+_CODES = {media_type: code for code, media_type in enumerate(MEDIA_TYPE_CODES)}
+
+# Export file name prefixes (movie_ids_MM_DD_YYYY.json.gz, ...)
+_FILE_PREFIXES = (
+    ("movie_ids", "movie"),
+    ("tv_series_ids", "tv"),
+    ("person_ids", "person"),
+)
+
+# Title fields of the export entries, in order of preference
+_TITLE_FIELDS = ("title", "name", "original_title", "original_name")
+
+
+def media_type_from_filename(path) -> str:
+    name = os.path.basename(str(path))
+    for prefix, media_type in _FILE_PREFIXES:
+        if name.startswith(prefix):
+            return media_type
+
+    return None
+
+
+class ExportIndex:
+    """
+    Maps titles to (media_type, id) using the daily ID exports
+    (https://developers.themoviedb.org/3/getting-started/daily-file-exports)
+
+    Files are streamed line by line. Only the canonical title (see title_index.canonical_title) is kept
+    per entry, ids, popularity and media types are stored in arrays. When several entries share a title,
+    the most popular one wins. Lookups are exact matches of the canonical title
+    """
+    def __init__(self, min_popularity=0.0, include_adult=False):
+        self.min_popularity = float(min_popularity)
+        self.include_adult = include_adult
+
+        # canonical title -> position in the arrays below
+        self.titles = {}
+        self.ids = array("l")
+        self.popularity = array("f")
+        self.media_types = array("b")
+
+    def __len__(self):
+        return len(self.titles)
+
+    def load(self, source, media_type: str = None) -> int:
+        """
+        Adds the entries of an export file (path to a .json.gz/.json file or a binary file object),
+        media_type is taken from the file name if not specified. Returns the number of indexed entries
+        """
+        if media_type is None:
+            media_type = media_type_from_filename(getattr(source, "name", source))
+        if media_type not in _CODES:
+            raise ValueError("Not a valid media_type: {}".format(media_type))
+
+        if isinstance(source, (str, bytes)) or hasattr(source, "__fspath__"):
+            if str(source).endswith(".gz"):
+                with gzip.open(source, "rb") as f:
+                    return self._load_lines(f, media_type)
+            else:
+                with open(source, "rb") as f:
+                    return self._load_lines(f, media_type)
+
+        return self._load_lines(source, media_type)
+
+    def _load_lines(self, lines, media_type) -> int:
+        count = 0
+
+        for line in lines:
+            if not line.strip():
+                continue
+
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                log.warning("Skipping malformed export line")
+                continue
+
+            if entry.get("adult") and not self.include_adult:
+                continue
+
+            popularity = entry.get("popularity") or 0.0
+            if popularity < self.min_popularity:
+                continue
+
+            for field in _TITLE_FIELDS:
+                if entry.get(field):
+                    if self.add(entry[field], media_type, entry["id"], popularity):
+                        count += 1
+                    break
+
+        log.info("Indexed {} {} entries from export".format(count, media_type))
+        return count
+
+    def add(self, title, media_type: str, id_: int, popularity=0.0) -> bool:
+        """
+        Adds a title, returns False if it's already taken by a more popular entry
+        """
+        canonical = canonical_title(title)
+        if not canonical:
+            return False
+
+        code = _CODES[media_type]
+
+        position = self.titles.get(canonical)
+        if position is None:
+            self.titles[canonical] = len(self.ids)
+            self.ids.append(int(id_))
+            self.popularity.append(popularity)
+            self.media_types.append(code)
+            return True
+
+        if popularity <= self.popularity[position]:
+            return False
+
+        self.ids[position] = int(id_)
+        self.popularity[position] = popularity
+        self.media_types[position] = code
+        return True
+
+    def lookup(self, query):
+        """
+        Returns (media_type, id) of the most popular entry with this title or None
+        """
+        position = self.titles.get(canonical_title(query))
+        if position is None:
+            return None
+
+        return MEDIA_TYPE_CODES[self.media_types[position]], self.ids[position]
@@ -0,0 +1,125 @@
+# coding=utf-8
+"""
+Identity map for Movie, TVShow and Person objects
+"""
+import logging
+import sys
+from weakref import WeakValueDictionary
+
+from .abstract import TMDbType, peek
+from .cache_manager import get_media_type
+
+log = logging.getLogger(__name__)
+log.setLevel(logging.INFO)
+
+
+# Fields that repeat across many items, only these are interned
+INTERNED_FIELDS = ("original_language", "genres", "media_type", "origin_country")
+
+# Bookkeeping slots that always follow the newest data
+_STATE_SLOTS = ("_raw", "_loader", "_appended")
+
+_MISSING = object()
+
+
+def _intern(value):
+    if isinstance(value, str):
+        return sys.intern(value)
+    if isinstance(value, list) and value and isinstance(value[0], str):
+        return [sys.intern(a) if isinstance(a, str) else a for a in value]
+
+    return value
+
+
+class IdentityMap:
+    """
+    Keeps at most one instance per (media_type, id) alive
+
+    Items built by the client are registered here. If the item is already known, either from the map
+    or from the cache, the new data is copied into the known instance, so references held by callers and
+    nested items (Person.known_for) stay current. Repeated strings (genre names, language codes, ...) are interned.
+    The map only holds weak references, so it never keeps items alive on its own
+    """
+    def __init__(self, cache=None):
+        # Must be the client's CacheManager, if any
+        self.cache = cache
+
+        self.items = WeakValueDictionary()
+
+    def __len__(self):
+        return len(self.items)
+
+    def get(self, key):
+        item = self.items.get(key)
+        if item is None and self.cache is not None:
+            item = self.cache.get_entry(key)
+            if item is not None:
+                self.items[key] = item
+
+        return item
+
+    def resolve(self, item):
+        """
+        Returns the known instance of an item or registers this one
+        """
+        key = (get_media_type(item), int(item.id))
+
+        existing = self.get(key)
+        if existing is not None:
+            return existing
+
+        return self.register(item)
+
+    def register(self, item):
+        """
+        Registers a freshly built top-level item and deduplicates its nested items,
+        returns the instance to use (the known one, updated with the item's data, if there is one)
+        """
+        key = (get_media_type(item), int(item.id))
+
+        existing = self.get(key)
+        if existing is not None and existing is not item and type(existing) is type(item):
+            self._merge(existing, item)
+            item = existing
+
+        self._intern_attributes(item)
+
+        # Don't build known_for of lazy items just to deduplicate it
+        known_for = peek(item, "known_for")
+        if known_for:
+            item.known_for = [self.resolve(a) if isinstance(a, TMDbType) else a for a in known_for]
+
+        self.items[key] = item
+        return item
+
+    @staticmethod
+    def _merge(existing, item):
+        """
+        Copies everything a new instance has into the known one
+        Attributes the new instance doesn't have are kept, unless they would be derived from its (lazy) response
+        """
+        raw = peek(item, "_raw")
+        derived = type(item)._derived
+
+        for cls in type(item).__mro__:
+            for slot in cls.__dict__.get("__slots__", ()):
+                if slot == "__weakref__":
+                    continue
+
+                value = peek(item, slot, _MISSING)
+                if value is not _MISSING:
+                    setattr(existing, slot, value)
+                elif slot in _STATE_SLOTS or (raw is not None and any(a in raw for a in derived.get(slot, ()))):
+                    try:
+                        delattr(existing, slot)
+                    except AttributeError:
+                        pass
+
+    @staticmethod
+    def _intern_attributes(item):
+        for name in INTERNED_FIELDS:
+            value = peek(item, name)
+            if value is not None:
+                interned = _intern(value)
+                if interned is not value:
+                    setattr(item, name, interned)
@@ -0,0 +1,115 @@
+# coding=utf-8
+"""
+Metrics for TMDbie
+"""
+import bisect
+import logging
+import time
+from urllib.parse import urlsplit
+
+log = logging.getLogger(__name__)
+log.setLevel(logging.INFO)
+
+# Latency histogram bucket upper bounds in seconds (the last bucket catches everything above)
+DEFAULT_BUCKETS = (0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def endpoint_family(url: str) -> str:
+    """
+    Groups endpoints by their first path segment: .../3/search/multi -> search, .../3/movie/603/videos -> movie
+    """
+    parts = [a for a in urlsplit(url).path.split("/") if a]
+    if parts and parts[0].isdigit():
+        parts = parts[1:]
+
+    return parts[0] if parts else "unknown"
+
+
+class Metrics:
+    """
+    In-process counters, gauges and latency histograms
+
+    Every metric has a name and an optional label (media type, endpoint family, ...).
+    Use snapshot() to scrape the current values
+    """
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+
+        # (name, label) -> value
+        self.counters = {}
+        self.gauges = {}
+        # (name, label) -> [count per bucket..., overflow count, sum]
+        self.histograms = {}
+
+        self.started = time.time()
+
+    def inc(self, name: str, label=None, value=1):
+        key = (name, label)
+        self.counters[key] = self.counters.get(key, 0) + value
+
+    def set_gauge(self, name: str, value, label=None):
+        self.gauges[(name, label)] = value
+
+    def add_gauge(self, name: str, value, label=None):
+        key = (name, label)
+        self.gauges[key] = self.gauges.get(key, 0) + value
+
+    def observe(self, name: str, value: float, label=None):
+        key = (name, label)
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = self.histograms[key] = [0] * (len(self.buckets) + 2)
+
+        histogram[bisect.bisect_left(self.buckets, value)] += 1
+        histogram[-1] += value
+
+    def snapshot(self) -> dict:
+        """
+        Returns all metrics as nested dicts: {"counters": {name: {label: value}}, "gauges": ..., "histograms": ...}
+        """
+        counters = {}
+        for (name, label), value in self.counters.items():
+            counters.setdefault(name, {})[label] = value
+
+        gauges = {}
+        for (name, label), value in self.gauges.items():
+            gauges.setdefault(name, {})[label] = value
+
+        histograms = {}
+        for (name, label), values in self.histograms.items():
+            counts = values[:-1]
+            histograms.setdefault(name, {})[label] = {
+                "count": sum(counts),
+                "sum": values[-1],
+                "buckets": dict(zip(self.buckets + (float("inf"),), counts)),
+            }
+
+        return {
+            "uptime": time.time() - self.started,
+            "counters": counters,
+            "gauges": gauges,
+            "histograms": histograms,
+        }
+
+    def reset(self):
+        self.counters.clear()
+        self.gauges.clear()
+        self.histograms.clear()
+        self.started = time.time()
+
+
+class NullMetrics(Metrics):
+    """
+    Discards everything, used until real metrics are attached
+    """
+    def inc(self, name: str, label=None, value=1):
+        pass
+
+    def set_gauge(self, name: str, value, label=None):
+        pass
+
+    def add_gauge(self, name: str, value, label=None):
+        pass
+
+    def observe(self, name: str, value: float, label=None):
+        pass
@@ -0,0 +1,110 @@
+# coding=utf-8
+"""
+Paginated results for TMDbie
+"""
+import asyncio
+import logging
+
+from .discover import MAX_PAGE
+
+log = logging.getLogger(__name__)
+log.setLevel(logging.INFO)
+
+
+class Paginator:
+    """
+    Iterates over all results of a paginated endpoint with async for
+
+    Pages are requested as they're needed. With prefetch, page N + 1 is already requested
+    while the results of page N are being consumed. Iterating is done by an async generator,
+    so breaking out of the loop (or dropping the iterator) cancels the pending prefetch
+    """
+    def __init__(self, fetch_page, instantiate=None, start_page=1, max_pages=None, prefetch=True):
+        # fetch_page(page) is a coroutine function returning the raw response
+        self._fetch_page = fetch_page
+        self._instantiate = instantiate
+
+        self.page = int(start_page) - 1
+        self.last_page = None if max_pages is None else self.page + int(max_pages)
+        self.total_pages = None
+        self.total_results = None
+        self.prefetch = prefetch
+
+        self._buffer = []
+        self._next = None
+        self._closed = False
+
+    def _has_next_page(self):
+        if self._closed:
+            return False
+        # TMDb reports more pages than it serves, anything after MAX_PAGE is an error
+        if self.page >= MAX_PAGE:
+            return False
+        if self.total_pages is not None and self.page >= min(self.total_pages, MAX_PAGE):
+            return False
+        if self.last_page is not None and self.page >= self.last_page:
+            return False
+
+        return True
+
+    def _request_next(self):
+        return asyncio.ensure_future(self._fetch_page(self.page + 1))
+
+    async def _load_page(self):
+        task = self._next if self._next is not None else self._request_next()
+        self._next = None
+
+        resp = await task
+        self.page += 1
+
+        if not resp:
+            self._closed = True
+            return []
+
+        self.total_pages = resp.get("total_pages", self.page)
+        self.total_results = resp.get("total_results")
+
+        # Request the next page while this one is being consumed
+        if self.prefetch and self._has_next_page():
+            self._next = self._request_next()
+
+        results = resp.get("results") or []
+        if self._instantiate is not None:
+            results = [a for a in map(self._instantiate, results) if a is not None]
+
+        return results
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        try:
+            while True:
+                while not self._buffer:
+                    if not self._has_next_page():
+                        return
+
+                    self._buffer = await self._load_page()
+                    self._buffer.reverse()
+
+                yield self._buffer.pop()
+        finally:
+            # Also runs when the consumer breaks out early or the generator is garbage collected
+            await self.aclose()
+
+    async def aclose(self):
+        """
+        Stops the iteration and cancels any prefetched page
+        """
+        self._closed = True
+        self._buffer = []
+
+        if self._next is not None:
+            self._next.cancel()
+            self._next = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.aclose()
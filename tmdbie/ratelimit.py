@@ -0,0 +1,159 @@
+# coding=utf-8
+"""
+Client-side rate limiting for TMDbie
+"""
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+
+log = logging.getLogger(__name__)
+log.setLevel(logging.INFO)
+
+
+class Priority:
+    """
+    Lower values are served first
+    """
+    INTERACTIVE = 0
+    DEFAULT = 5
+    BACKGROUND = 10
+
+
+class RateLimiter:
+    """
+    Token bucket that paces outgoing requests
+
+    The bucket refills at rate/per, but is corrected with the X-RateLimit-* headers TMDb sends
+    so the client never goes over its quota. Waiting requests are woken up by priority, then in FIFO order
+    """
+    def __init__(self, rate=40, per=10.0):
+        self.capacity = int(rate)
+        self.per = float(per)
+
+        self.tokens = float(self.capacity)
+        self._last_refill = time.monotonic()
+
+        # Monotonic time until which no requests are sent (set by Retry-After and exhausted quotas)
+        self._blocked_until = 0.0
+
+        self._waiters = []
+        self._counter = itertools.count()
+        self._wakeup_handle = None
+
+        self.remaining = None
+        self.reset_at = None
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self._last_refill) * self.capacity / self.per)
+        self._last_refill = now
+
+    def _delay(self) -> float:
+        """
+        Seconds until the next token is available
+        """
+        now = time.monotonic()
+        if self._blocked_until > now:
+            return self._blocked_until - now
+
+        self._refill()
+        if self.tokens >= 1:
+            return 0.0
+
+        return (1 - self.tokens) * self.per / self.capacity
+
+    def _take(self):
+        self._refill()
+        self.tokens -= 1
+
+    def available(self) -> float:
+        """
+        Tokens that could be taken right now without waiting
+        """
+        if self._waiters or self._blocked_until > time.monotonic():
+            return 0.0
+
+        self._refill()
+        return self.tokens
+
+    def try_acquire(self, reserve=0) -> bool:
+        """
+        Takes a token only if one is available right now and at least `reserve` more would be left,
+        never waits (used for optional requests)
+        """
+        if self._waiters or self._delay() > 0 or self.tokens < 1 + reserve:
+            return False
+
+        self._take()
+        return True
+
+    async def acquire(self, priority=Priority.DEFAULT):
+        """
+        Waits until a request with the given priority is allowed to be sent
+        """
+        if not self._waiters and self._delay() == 0:
+            self._take()
+            return
+
+        future = asyncio.get_event_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._counter), future))
+        self._schedule()
+
+        await future
+
+    def _schedule(self):
+        if self._wakeup_handle is not None:
+            self._wakeup_handle.cancel()
+            self._wakeup_handle = None
+
+        # Drop waiters that were cancelled in the meantime
+        while self._waiters and self._waiters[0][2].done():
+            heapq.heappop(self._waiters)
+
+        while self._waiters:
+            delay = self._delay()
+            if delay > 0:
+                self._wakeup_handle = asyncio.get_event_loop().call_later(delay, self._schedule)
+                return
+
+            _, _, future = heapq.heappop(self._waiters)
+            if future.done():
+                continue
+
+            self._take()
+            future.set_result(None)
+
+    def block_for(self, seconds: float):
+        """
+        Stops sending requests for the given amount of seconds (used with Retry-After)
+        """
+        self._blocked_until = max(self._blocked_until, time.monotonic() + max(0.0, seconds))
+
+    def update(self, headers):
+        """
+        Synchronizes the bucket with the X-RateLimit-* response headers
+        """
+        limit = headers.get("X-RateLimit-Limit")
+        remaining = headers.get("X-RateLimit-Remaining")
+        reset = headers.get("X-RateLimit-Reset")
+
+        try:
+            if limit is not None:
+                self.capacity = max(1, int(limit))
+            if remaining is not None:
+                self.remaining = int(remaining)
+                # Requests still in flight were already taken from the bucket, so only ever lower it
+                self.tokens = min(self.tokens, float(self.remaining))
+            if reset is not None:
+                self.reset_at = int(reset)
+        except ValueError:
+            log.debug("Invalid ratelimit headers: {} {} {}".format(limit, remaining, reset))
+            return
+
+        log.debug("X-RateLimit-Remaining is {}".format(self.remaining))
+
+        # Quota is exhausted: don't send anything until the window resets
+        if self.remaining == 0 and self.reset_at:
+            self.block_for(self.reset_at - time.time())
@@ -0,0 +1,71 @@
+# coding=utf-8
+"""
+Timeouts, retries and hedged requests for TMDbie connectors
+"""
+import logging
+import random
+from collections import deque
+
+log = logging.getLogger(__name__)
+log.setLevel(logging.INFO)
+
+
+class RetryPolicy:
+    """
+    How connectors deal with slow and failing requests
+
+    - connect_timeout/read_timeout (seconds) are passed to the underlying HTTP library
+    - failed attempts (timeouts, connection errors and retry_statuses) are retried up to max_retries times,
+      waiting a random time between 0 and backoff_base * 2^attempt (at most backoff_max) in between ("full jitter")
+    - with hedge=True, a duplicate request is sent if the first one takes longer than the hedge_quantile
+      of recent latencies of the same endpoint family, the first response wins. Hedged requests are only
+      sent if the rate limiter has a token to spare (keeping hedge_reserve tokens for regular requests)
+    """
+    def __init__(self, connect_timeout=3.05, read_timeout=10.0, max_retries=2, backoff_base=0.25, backoff_max=8.0,
+                 retry_statuses=(500, 502, 503, 504), hedge=False, hedge_quantile=0.95, hedge_min_delay=0.05,
+                 hedge_min_samples=20, hedge_reserve=5, latency_window=200):
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+
+        self.max_retries = max(0, int(max_retries))
+        self.backoff_base = float(backoff_base)
+        self.backoff_max = float(backoff_max)
+        self.retry_statuses = frozenset(retry_statuses)
+
+        self.hedge = hedge
+        self.hedge_quantile = float(hedge_quantile)
+        self.hedge_min_delay = float(hedge_min_delay)
+        self.hedge_min_samples = int(hedge_min_samples)
+        self.hedge_reserve = int(hedge_reserve)
+
+        # endpoint family -> latencies of recent successful requests
+        self.latency_window = int(latency_window)
+        self._latencies = {}
+
+    def backoff(self, attempt: int) -> float:
+        """
+        Seconds to wait before retrying after the given (zero-based) attempt failed
+        """
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def record_latency(self, family: str, seconds: float):
+        latencies = self._latencies.get(family)
+        if latencies is None:
+            latencies = self._latencies[family] = deque(maxlen=self.latency_window)
+
+        latencies.append(seconds)
+
+    def hedge_delay(self, family: str):
+        """
+        Seconds after which to send a hedged request, None if hedging is off or there's not enough data yet
+        """
+        if not self.hedge:
+            return None
+
+        latencies = self._latencies.get(family)
+        if not latencies or len(latencies) < self.hedge_min_samples:
+            return None
+
+        ordered = sorted(latencies)
+        index = min(len(ordered) - 1, int(len(ordered) * self.hedge_quantile))
+        return max(self.hedge_min_delay, ordered[index])
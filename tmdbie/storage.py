@@ -0,0 +1,216 @@
+# coding=utf-8
+"""
+Persistent storage backends for the CacheManager
+"""
+import json
+import logging
+import sqlite3
+import threading
+import time
+import zlib
+
+from .abstract import TMDbType, peek
+from .cache_manager import get_media_type
+
+log = logging.getLogger(__name__)
+log.setLevel(logging.INFO)
+
+
+def serialize_item(item) -> dict:
+    """
+    Converts a Movie, TVShow or Person (including nested known_for items) into a plain dict
+    """
+    data = {"media_type": get_media_type(item)}
+
+    for slot in type(item).__slots__:
+        if not hasattr(item, slot):
+            continue
+
+        value = getattr(item, slot)
+        if isinstance(value, TMDbType):
+            value = serialize_item(value)
+        elif isinstance(value, list):
+            value = [serialize_item(a) if isinstance(a, TMDbType) else a for a in value]
+
+        data[slot] = value
+
+    # Sub-resources the item was built with
+    appended = peek(item, "_appended")
+    if appended:
+        data["_appended"] = list(appended)
+
+    return data
+
+
+def deserialize_item(data: dict):
+    """
+    Inverse of serialize_item, restores attributes as they were without running them through the constructor
+    """
+    from .types import Movie, TVShow, Person
+    types = {"movie": Movie, "tv": TVShow, "person": Person}
+
+    type_ = types.get(data.get("media_type"))
+    if not type_:
+        raise TypeError("Not a valid media_type: {}".format(data.get("media_type")))
+
+    item = type_.__new__(type_)
+    for name, value in data.items():
+        if isinstance(value, dict) and "media_type" in value:
+            value = deserialize_item(value)
+        elif isinstance(value, list):
+            value = [deserialize_item(a) if isinstance(a, dict) and "media_type" in a else a for a in value]
+
+        setattr(item, name, value)
+
+    return item
+
+
+def encode(data: dict) -> bytes:
+    return zlib.compress(json.dumps(data, separators=(",", ":")).encode("utf-8"))
+
+
+def decode(blob: bytes) -> dict:
+    return json.loads(zlib.decompress(blob).decode("utf-8"))
+
+
+class Storage:
+    """
+    Base class for CacheManager storage backends
+
+    Keys are (media_type, id) tuples, items are stored alongside the time they were cached
+    """
+    def load(self, key):
+        """
+        Returns (item, timestamp) or None if not stored
+        """
+        raise NotImplementedError
+
+    def load_key_by_name(self, name):
+        """
+        Returns the key a name points to or None
+        """
+        raise NotImplementedError
+
+    def store(self, key, item, timestamp, names=()):
+        raise NotImplementedError
+
+    def store_names(self, key, names):
+        """
+        Adds names that point to a stored item
+        """
+        raise NotImplementedError
+
+    def touch(self, key, timestamp):
+        """
+        Updates the timestamp of a stored item
+        """
+        raise NotImplementedError
+
+    def sweep(self, max_age):
+        """
+        Deletes entries older than max_age, returns the number of deleted entries
+        """
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class SQLiteStorage(Storage):
+    """
+    Stores compressed items in a SQLite database
+
+    The database is opened on first use and nothing is loaded up-front, items are read as they're looked up.
+    With wal=True the database uses write-ahead logging, so multiple processes can read while one writes
+    """
+    def __init__(self, path: str, wal=False, timeout=5.0):
+        self.path = str(path)
+        self.wal = wal
+        self.timeout = timeout
+
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def _connection(self):
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path, timeout=self.timeout, check_same_thread=False)
+            if self.wal:
+                self._conn.execute("PRAGMA journal_mode=WAL")
+                self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript(
+                "CREATE TABLE IF NOT EXISTS items ("
+                "  media_type TEXT NOT NULL, id INTEGER NOT NULL, timestamp REAL NOT NULL, data BLOB NOT NULL,"
+                "  PRIMARY KEY (media_type, id));"
+                "CREATE TABLE IF NOT EXISTS names ("
+                "  name TEXT PRIMARY KEY, media_type TEXT NOT NULL, id INTEGER NOT NULL);"
+                "CREATE INDEX IF NOT EXISTS items_timestamp ON items (timestamp);"
+            )
+            log.debug("Opened cache storage at {}".format(self.path))
+
+        return self._conn
+
+    def load(self, key):
+        with self._lock:
+            row = self._connection().execute(
+                "SELECT data, timestamp FROM items WHERE media_type = ? AND id = ?", key
+            ).fetchone()
+
+        if row is None:
+            return None
+
+        try:
+            item = deserialize_item(decode(row[0]))
+        except (ValueError, TypeError, zlib.error):
+            log.warning("Corrupt cache entry for {} {}, ignoring".format(*key))
+            return None
+
+        return item, row[1]
+
+    def load_key_by_name(self, name):
+        with self._lock:
+            row = self._connection().execute(
+                "SELECT media_type, id FROM names WHERE name = ?", (name,)
+            ).fetchone()
+
+        return tuple(row) if row else None
+
+    def store(self, key, item, timestamp, names=()):
+        blob = encode(serialize_item(item))
+
+        with self._lock:
+            conn = self._connection()
+            with conn:
+                conn.execute("INSERT OR REPLACE INTO items VALUES (?, ?, ?, ?)", (key[0], key[1], timestamp, blob))
+                conn.executemany("INSERT OR REPLACE INTO names VALUES (?, ?, ?)",
+                                 [(name, key[0], key[1]) for name in names])
+
+    def store_names(self, key, names):
+        with self._lock:
+            conn = self._connection()
+            with conn:
+                conn.executemany("INSERT OR REPLACE INTO names VALUES (?, ?, ?)",
+                                 [(name, key[0], key[1]) for name in names])
+
+    def touch(self, key, timestamp):
+        with self._lock:
+            conn = self._connection()
+            with conn:
+                conn.execute("UPDATE items SET timestamp = ? WHERE media_type = ? AND id = ?", (timestamp, key[0], key[1]))
+
+    def sweep(self, max_age):
+        threshold = time.time() - max_age
+
+        with self._lock:
+            conn = self._connection()
+            with conn:
+                deleted = conn.execute("DELETE FROM items WHERE timestamp < ?", (threshold,)).rowcount
+                conn.execute("DELETE FROM names WHERE NOT EXISTS "
+                             "(SELECT 1 FROM items WHERE items.media_type = names.media_type AND items.id = names.id)")
+
+        return deleted
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
@@ -0,0 +1,169 @@
+# coding=utf-8
+"""
+Normalized and fuzzy title matching for the CacheManager
+"""
+import logging
+import math
+import re
+import unicodedata
+
+log = logging.getLogger(__name__)
+log.setLevel(logging.INFO)
+
+_ARTICLES = {"the", "a", "an"}
+_NON_WORD = re.compile(r"[^\w\s]")
+_YEAR = re.compile(r"^(18|19|20)\d\d$")
+# Sequel and part numbers, arabic or roman (up to 39)
+_NUMBER = re.compile(r"^(\d+|x{0,3}(ix|iv|v?i{0,3}))$")
+
+
+def canonical_title(text) -> str:
+    """
+    Lowercases, strips accents, punctuation, articles and years:
+    "The Matrix (1999)" -> "matrix"
+    """
+    text = unicodedata.normalize("NFKD", str(text).lower())
+    text = "".join(a for a in text if not unicodedata.combining(a))
+    text = _NON_WORD.sub(" ", text)
+
+    tokens = [a for a in text.split() if a not in _ARTICLES and not _YEAR.match(a)]
+    # Don't strip titles that consist only of articles/years
+    if not tokens:
+        tokens = text.split()
+
+    return " ".join(tokens)
+
+
+def similar_tokens(query: str, candidate: str) -> bool:
+    """
+    Whether two canonical titles can be the same title with typos: same number of words and no word
+    that differs only by a number or by a prefix/suffix ("toy story 2", "predators" and "incredible"
+    are different titles from "toy story", "predator" and "incredibles")
+    """
+    a, b = query.split(), candidate.split()
+    if len(a) != len(b):
+        return False
+
+    for x, y in zip(a, b):
+        if x == y:
+            continue
+        if _NUMBER.match(x) or _NUMBER.match(y):
+            return False
+        if x.startswith(y) or y.startswith(x) or x.endswith(y) or y.endswith(x):
+            return False
+
+    return True
+
+
+def trigrams(text: str) -> set:
+    padded = "  {} ".format(text)
+    return {padded[a:a + 3] for a in range(len(padded) - 2)}
+
+
+class TitleIndex:
+    """
+    Maps titles of cached items to their keys
+
+    Lookups first try the canonical form of a title and then the most similar title by
+    trigram similarity (Dice coefficient), which has to reach the threshold and pass similar_tokens.
+    Only titles sharing one of the query's rarest trigrams are scored, at most max_candidates of them
+    """
+    def __init__(self, threshold=0.8, max_candidates=256):
+        self.threshold = threshold
+        self.max_candidates = int(max_candidates)
+
+        # canonical title -> key
+        self.canonical = {}
+        # key -> {canonical title: trigrams}
+        self.titles = {}
+        # trigram -> set of canonical titles
+        self.trigram_index = {}
+
+    def __len__(self):
+        return len(self.titles)
+
+    def add(self, key, titles):
+        for title in titles:
+            if not title:
+                continue
+
+            canonical = canonical_title(title)
+            if not canonical:
+                continue
+
+            previous = self.canonical.get(canonical)
+            if previous is not None and previous != key:
+                self._remove_title(previous, canonical)
+
+            grams = trigrams(canonical)
+            self.canonical[canonical] = key
+            self.titles.setdefault(key, {})[canonical] = grams
+
+            for gram in grams:
+                self.trigram_index.setdefault(gram, set()).add(canonical)
+
+    def _remove_title(self, key, canonical):
+        grams = self.titles.get(key, {}).pop(canonical, ())
+        if key in self.titles and not self.titles[key]:
+            del self.titles[key]
+
+        for gram in grams:
+            bucket = self.trigram_index.get(gram)
+            if bucket is not None:
+                bucket.discard(canonical)
+                if not bucket:
+                    del self.trigram_index[gram]
+
+    def remove(self, key):
+        for canonical in list(self.titles.get(key, ())):
+            self._remove_title(key, canonical)
+            if self.canonical.get(canonical) == key:
+                del self.canonical[canonical]
+
+    def lookup(self, query, fuzzy=True):
+        """
+        Returns (key, confidence) of the best match or None
+        Without fuzzy, only titles with the same canonical form match
+        """
+        canonical = canonical_title(query)
+        if not canonical:
+            return None
+
+        key = self.canonical.get(canonical)
+        if key is not None:
+            return key, 1.0
+
+        if not fuzzy or self.threshold is None:
+            return None
+
+        grams = trigrams(canonical)
+
+        # A title reaching the threshold shares at least `needed` trigrams with the query,
+        # so it contains one of the query's len(grams) - needed + 1 rarest trigrams
+        needed = int(math.ceil(self.threshold * len(grams) / (2.0 - self.threshold)))
+        rarest = sorted(grams, key=lambda a: len(self.trigram_index.get(a, ())))[:max(1, len(grams) - needed + 1)]
+
+        candidates = set()
+        for gram in rarest:
+            for candidate in self.trigram_index.get(gram, ()):
+                candidates.add(candidate)
+                if len(candidates) >= self.max_candidates:
+                    break
+            else:
+                continue
+            break
+
+        best, best_score = None, 0.0
+        for candidate in candidates:
+            candidate_key = self.canonical[candidate]
+            candidate_grams = self.titles[candidate_key][candidate]
+            score = 2.0 * len(grams & candidate_grams) / (len(grams) + len(candidate_grams))
+
+            if score > best_score and score >= self.threshold and similar_tokens(canonical, candidate):
+                best, best_score = candidate_key, score
+
+        if best is None or best_score < self.threshold:
+            return None
+
+        log.debug("Fuzzy matched {} with confidence {:.2f}".format(query, best_score))
+        return best, best_score
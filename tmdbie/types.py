@@ -4,17 +4,16 @@ Types used in TMDbie
 """
 import logging
 
-from .cache_manager import CacheManager
-from .abstract import TMDbType
+from .cache_manager import get_cache
+from .abstract import TMDbType, compile_fields, peek
 
 log = logging.getLogger(__name__)
 log.setLevel(logging.INFO)
 
-cache = CacheManager()
-
 _BASE = "https://api.themoviedb.org/3"
 
 IMDB_VIDEO_BASE = "http://www.imdb.com/title/{}/videogallery"
+YOUTUBE_VIDEO_BASE = "https://www.youtube.com/watch?v={}"
 
 
 class Endpoints:
@@ -35,18 +34,186 @@ class Endpoints:
         MOVIE = _BASE + "/discover/movie"
         TV = _BASE + "/discover/tv"
 
+    class Trending:
+        ALL_DAY = _BASE + "/trending/all/day"
+        ALL_WEEK = _BASE + "/trending/all/week"
+
+    class Genres:
+        MOVIE = _BASE + "/genre/movie/list"
+        TV = _BASE + "/genre/tv/list"
+
+    CONFIGURATION = _BASE + "/configuration"
+
 
+    # SUB_RESOURCES maps append_to_response names to their standalone endpoints
     class Movie:
         DETAILS = _BASE + "/movie/{id}"
         VIDEOS = _BASE + "/movie/{id}/videos"
+        EXTERNAL_IDS = _BASE + "/movie/{id}/external_ids"
+        CREDITS = _BASE + "/movie/{id}/credits"
+        POPULAR = _BASE + "/movie/popular"
+
+        SUB_RESOURCES = {"videos": VIDEOS, "external_ids": EXTERNAL_IDS, "credits": CREDITS}
 
     class People:
         DETAILS = _BASE + "/person/{id}"
         EXTERNAL_IDS = _BASE + "/person/{id}/external_ids"
+        COMBINED_CREDITS = _BASE + "/person/{id}/combined_credits"
+        POPULAR = _BASE + "/person/popular"
+
+        SUB_RESOURCES = {"external_ids": EXTERNAL_IDS, "combined_credits": COMBINED_CREDITS}
 
     class TVShow:
         DETAILS = _BASE + "/tv/{id}"
+        VIDEOS = _BASE + "/tv/{id}/videos"
         EXTERNAL_IDS = _BASE + "/tv/{id}/external_ids"
+        CREDITS = _BASE + "/tv/{id}/credits"
+        POPULAR = _BASE + "/tv/popular"
+
+        SUB_RESOURCES = {"videos": VIDEOS, "external_ids": EXTERNAL_IDS, "credits": CREDITS}
+
+
+class ReferenceData:
+    """
+    Genre names and image base urls used when instantiating types
+    Defaults to the hardcoded image bases until Client.load_reference_data fills it in
+    """
+    def __init__(self):
+        # media_type -> {genre id: name}
+        self.genres = {"movie": {}, "tv": {}}
+
+        self.poster_base = Endpoints.POSTER_BASE
+        self.backdrop_base = Endpoints.BACKDROP_BASE
+
+        # When it was last loaded (0 = never)
+        self.timestamp = 0
+
+    def update_genres(self, media_type: str, response: dict):
+        self.genres[media_type] = {a["id"]: a["name"] for a in (response or {}).get("genres", []) if "id" in a}
+
+    def update_configuration(self, response: dict, poster_size="w500", backdrop_size="w780"):
+        images = (response or {}).get("images") or {}
+        base = images.get("secure_base_url") or images.get("base_url")
+        if not base:
+            return
+
+        poster_sizes = images.get("poster_sizes") or [poster_size]
+        backdrop_sizes = images.get("backdrop_sizes") or [backdrop_size]
+
+        # Fall back to the largest size if ours isn't offered anymore
+        self.poster_base = base + (poster_size if poster_size in poster_sizes else poster_sizes[-1])
+        self.backdrop_base = base + (backdrop_size if backdrop_size in backdrop_sizes else backdrop_sizes[-1])
+
+
+# Shared by all clients, genres and image urls are the same for every api key
+reference = ReferenceData()
+
+
+def _find_trailer(videos):
+    """
+    Returns the url of the first YouTube trailer in a videos response (or None)
+    """
+    for video in (videos or {}).get("results", []):
+        if video.get("site") == "YouTube" and video.get("type") == "Trailer" and video.get("key"):
+            return YOUTUBE_VIDEO_BASE.format(video.get("key"))
+
+    return None
+
+
+def _set_imdb_id(obj, value):
+    # A trailer from the videos sub-resource takes precedence
+    if value and peek(obj, "trailer") is None:
+        obj.trailer = IMDB_VIDEO_BASE.format(value)
+    obj.imdb_id = value
+
+
+def _set_videos(obj, value):
+    trailer = _find_trailer(value)
+    if trailer:
+        obj.trailer = trailer
+
+
+def _set_external_ids(obj, value):
+    obj.external_ids = value
+    if value and value.get("imdb_id") and peek(obj, "imdb_id") is None:
+        handler = obj._fields.get("imdb_id")
+        if handler is None:
+            obj.imdb_id = value.get("imdb_id")
+        else:
+            handler(obj, value.get("imdb_id"))
+
+
+def _set_poster(obj, value):
+    obj.poster = reference.poster_base + value if value else None
+
+
+def _set_backdrop(obj, value):
+    obj.backdrop = reference.backdrop_base + value if value else None
+
+
+def _set_genres(obj, value):
+    obj.genres = [name.get("name") for name in value]
+
+
+def _genre_ids_handler(media_type):
+    def _set_genre_ids(obj, value):
+        obj.genre_ids = value
+
+        # List results only have ids, full genres from details take precedence
+        if value and peek(obj, "genres") is None:
+            names = reference.genres[media_type]
+            if names:
+                obj.genres = [names[a] for a in value if a in names]
+
+    return _set_genre_ids
+
+
+def _set_name(obj, value):
+    obj.name = value
+    obj.title = value
+
+
+def _set_known_for(obj, value):
+    # Nothing can be cached before a cache exists
+    cache = get_cache()
+
+    known_for = []
+    for entry in value:
+        # Check if already available in cache, otherwise instantiate
+        type_ = entry.get("media_type")
+        from_cache = cache.get_entry((type_, entry.get("id"))) if cache is not None else None
+
+        if from_cache:
+            known_for.append(from_cache)
+        else:
+            if type_ == "movie":
+                item = Movie.from_response(entry)
+            elif type_ == "tv":
+                item = TVShow.from_response(entry)
+            else:
+                raise RuntimeError
+
+            known_for.append(item)
+
+    obj.known_for = known_for
+
+
+# response key: (handler, attributes it sets)
+_MEDIA_HANDLERS = {
+    "imdb_id": (_set_imdb_id, ("imdb_id", "trailer")),
+    "videos": (_set_videos, ("trailer",)),
+    "external_ids": (_set_external_ids, ("external_ids", "imdb_id", "trailer")),
+    "poster_path": (_set_poster, ("poster",)),
+    "backdrop_path": (_set_backdrop, ("backdrop",)),
+    "genres": (_set_genres, ("genres",)),
+    "name": (_set_name, ("name", "title")),
+    "title": (_set_name, ("name", "title")),
+}
+
+_PERSON_HANDLERS = {
+    "known_for": (_set_known_for, ("known_for",)),
+    "external_ids": (_set_external_ids, ("external_ids", "imdb_id")),
+}
 
 
 class Movie(TMDbType):
@@ -55,39 +222,10 @@ class Movie(TMDbType):
         "original_title", "genre_ids", "id", "media_type",
         "original_language", "title", "backdrop", "popularity",
         "vote_count", "video", "vote_average", "imdb_id", "trailer",
-        "genres", "name"
+        "genres", "name", "runtime", "external_ids", "credits"
     )
 
-    def __init__(self, **kwargs):
-        self._set_attributes(**kwargs)
-
-    def _set_attributes(self, **kwargs):
-        for arg, value in kwargs.items():
-            if arg == "imdb_id":
-                self.__setattr__("trailer", IMDB_VIDEO_BASE.format(value))
-                self.__setattr__(arg, value)
-            elif arg == "poster_path":
-                if not value:
-                    self.__setattr__("poster", None)
-                else:
-                    self.__setattr__("poster", Endpoints.POSTER_BASE + value)
-            elif arg == "backdrop_path":
-                if not value:
-                    self.__setattr__("backdrop", None)
-                else:
-                    self.__setattr__("backdrop", Endpoints.BACKDROP_BASE + value)
-            elif arg == "genres":
-                genres = [name.get("name") for name in value]
-                self.__setattr__(arg, genres)
-            elif arg in ["name", "title"]:
-                self.__setattr__("name", value)
-                self.__setattr__("title", value)
-
-            else:
-                try:
-                    self.__setattr__(arg, value)
-                except AttributeError:
-                    pass
+    _details_only = ("genres", "imdb_id", "trailer", "runtime", "external_ids", "credits")
 
 
 class TVShow(TMDbType):
@@ -96,76 +234,24 @@ class TVShow(TMDbType):
         "popularity", "id", "backdrop", "vote_average", "media_type",
         "origin_country", "genre_ids", "original_language", "vote_count",
         "name", "title", "original_name", "imdb_id", "seasons", "trailer", "genres",
-        "runtime"
+        "runtime", "external_ids", "credits"
     )
 
-    def __init__(self, **kwargs):
-        self._set_attributes(**kwargs)
-
-    def _set_attributes(self, **kwargs):
-        for arg, value in kwargs.items():
-            if arg == "imdb_id":
-                self.__setattr__("trailer", IMDB_VIDEO_BASE.format(value))
-                self.__setattr__(arg, value)
-            elif arg == "poster_path":
-                if not value:
-                    self.__setattr__("poster", None)
-                else:
-                    self.__setattr__("poster", Endpoints.POSTER_BASE + value)
-            elif arg == "backdrop_path":
-                if not value:
-                    self.__setattr__("backdrop", None)
-                else:
-                    self.__setattr__("backdrop", Endpoints.BACKDROP_BASE + value)
-            elif arg == "genres":
-                genres = [name.get("name") for name in value]
-                self.__setattr__(arg, genres)
-            elif arg in ["name", "title"]:
-                self.__setattr__("name", value)
-                self.__setattr__("title", value)
-
-            else:
-                try:
-                    self.__setattr__(arg, value)
-                except AttributeError:
-                    pass
+    _details_only = ("genres", "imdb_id", "trailer", "runtime", "seasons", "external_ids", "credits")
 
 
 class Person(TMDbType):
     __slots__ = (
         "profile_path", "adult", "id", "media_type",
-        "known_for", "name", "popularity", "imdb_id"
+        "known_for", "name", "popularity", "imdb_id",
+        "biography", "birthday", "deathday", "place_of_birth",
+        "external_ids", "combined_credits"
     )
 
-    def __init__(self, **kwargs):
-        self._set_attributes(**kwargs)
-
-    def _set_attributes(self, **kwargs):
-        if kwargs.get("known_for"):
-            known_for = []
-            for entry in kwargs.get("known_for"):
-                # Check if already available in cache, otherwise instantiate
-                from_cache = cache.get_from_cache(kwargs.get("id"))
-                if from_cache:
-                    known_for.append(from_cache)
-                else:
-                    type_ = entry.get("media_type")
-
-                    if type_ == "movie":
-                        item = Movie(**entry)
-                    elif type_ == "tv":
-                        item = TVShow(**entry)
-                    else:
-                        raise RuntimeError
-
-                    known_for.append(item)
-
-            # Remove from dict
-            kwargs.pop("known_for")
-            self.__setattr__("known_for", known_for)
-
-        for arg, value in kwargs.items():
-            try:
-                self.__setattr__(arg, value)
-            except AttributeError:
-                pass
+    _details_only = ("imdb_id", "biography", "birthday", "deathday", "place_of_birth", "external_ids",
+                     "combined_credits")
+
+
+compile_fields(Movie, dict(_MEDIA_HANDLERS, genre_ids=(_genre_ids_handler("movie"), ("genre_ids", "genres"))))
+compile_fields(TVShow, dict(_MEDIA_HANDLERS, genre_ids=(_genre_ids_handler("tv"), ("genre_ids", "genres"))))
+compile_fields(Person, _PERSON_HANDLERS)
@@ -49,15 +49,14 @@ def get_media_type(data):
     return real_type
 
 
-def instantiate_type(data):
+def instantiate_type(data, lazy=False, project=False):
     if not data:
         return None
 
     type_ = get_media_type(data.get("media_type"))
 
     # Includes subclasses
-    if not isinstance(type_, TMDbType):
+    if not issubclass(type_, TMDbType):
         raise TypeError("This shouldn't happen, please notify the developer!")
 
-    # noinspection PyCallingNonCallable
-    return type_(**data)
+    return type_.from_response(data, lazy=lazy, project=project)
@@ -0,0 +1,254 @@
+# coding=utf-8
+"""
+Background cache warming for TMDbie
+"""
+import asyncio
+import json
+import logging
+import os
+import time
+
+from .cache_manager import normalize_query
+from .client import SEARCH_APPENDS, _ENDPOINT_MEDIA_TYPES
+from .ratelimit import Priority
+from .types import Endpoints
+
+log = logging.getLogger(__name__)
+log.setLevel(logging.INFO)
+
+# Lists the warmer pulls by default
+DEFAULT_LISTS = (
+    Endpoints.Trending.ALL_WEEK,
+    Endpoints.Movie.POPULAR,
+    Endpoints.TVShow.POPULAR,
+)
+
+
+class QueryLog:
+    """
+    Counts search queries, optionally persisted to a JSON file
+
+    Only queries seen within max_age seconds count, at most max_entries queries are kept
+    (the least frequent ones are dropped first, down to trim_ratio of max_entries so trimming is rare)
+    """
+    def __init__(self, path: str = None, max_age=7 * 86400, max_entries=5000, trim_ratio=0.9):
+        self.path = path
+        self.max_age = max_age
+        self.max_entries = int(max_entries)
+        self.trim_ratio = float(trim_ratio)
+
+        # normalized query -> [count, last seen]
+        self.queries = {}
+
+        if path is not None and os.path.exists(path):
+            self.load()
+
+    def __len__(self):
+        return len(self.queries)
+
+    def record(self, query):
+        query = normalize_query(query)
+
+        entry = self.queries.get(query)
+        if entry is None:
+            entry = self.queries[query] = [0, 0]
+        entry[0] += 1
+        entry[1] = time.time()
+
+        if len(self.queries) > self.max_entries:
+            self._trim()
+
+    def _trim(self):
+        keep = max(1, int(self.max_entries * self.trim_ratio))
+        ordered = sorted(self.queries.items(), key=lambda a: (a[1][0], a[1][1]), reverse=True)
+        self.queries = dict(ordered[:keep])
+
+    def top(self, count: int) -> list:
+        """
+        Most frequent recent queries, most frequent first
+        """
+        threshold = time.time() - self.max_age
+        recent = [(query, entry) for query, entry in self.queries.items() if entry[1] >= threshold]
+        recent.sort(key=lambda a: (a[1][0], a[1][1]), reverse=True)
+
+        return [query for query, _ in recent[:count]]
+
+    def load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            log.warning("Could not load query log from {}: {}".format(self.path, e))
+            return
+
+        self.queries = {query: list(entry) for query, entry in data.items()}
+
+    def _snapshot(self) -> dict:
+        threshold = time.time() - self.max_age
+        return {query: list(entry) for query, entry in self.queries.items() if entry[1] >= threshold}
+
+    def save(self):
+        if self.path is None:
+            return
+
+        self._write(self._snapshot())
+
+    async def asave(self):
+        """
+        Like save, but writes the file in the default executor so it doesn't block the event loop
+        """
+        if self.path is None:
+            return
+
+        # Copied here, record() may change the entries while the file is written
+        data = self._snapshot()
+        await asyncio.get_event_loop().run_in_executor(None, self._write, data)
+
+    def _write(self, data: dict):
+        # Write to a temporary file first so a crash never leaves a half-written log
+        temp = "{}.tmp".format(self.path)
+        with open(temp, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        os.replace(temp, self.path)
+
+
+class CacheWarmer:
+    """
+    Periodically fills the client's cache with popular items so the first lookups after a cold start are hits
+
+    Every `interval` seconds, items from the trending/popular `lists` (first `list_pages` pages) and the
+    `top_queries` most frequent queries of the query log are fetched if they're not cached or would
+    go stale before the next run. Items that are about to go stale are revalidated (cheap if unchanged).
+
+    At most `budget` requests are sent per run (a query counts as two), all at BACKGROUND priority,
+    and only while the rate limiter has more than `reserve` tokens left for interactive requests
+    """
+    def __init__(self, client, interval=900, budget=100, lists=DEFAULT_LISTS, list_pages=1, query_log=None,
+                 top_queries=50, reserve=10, priority=Priority.BACKGROUND):
+        self.client = client
+
+        self.interval = interval
+        self.budget = int(budget)
+        self.lists = tuple(lists)
+        self.list_pages = int(list_pages)
+        self.query_log = query_log
+        self.top_queries = int(top_queries)
+        self.reserve = reserve
+        self.priority = priority
+
+        self._task = None
+        self._spent = 0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self):
+        if not self.running:
+            self._task = asyncio.ensure_future(self._run_forever())
+        return self
+
+    async def stop(self):
+        task, self._task = self._task, None
+        if task is None:
+            return
+
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+
+    async def _run_forever(self):
+        while True:
+            try:
+                await self.run_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                log.warning("Cache warming failed: {}".format(e))
+
+            await asyncio.sleep(self.interval)
+
+    async def _spend(self, cost=1) -> bool:
+        """
+        Waits until warming doesn't compete with other requests, returns False if the budget is used up
+        """
+        if self._spent + cost > self.budget:
+            return False
+
+        limiter = self.client.req.limiter
+        while limiter.available() < min(self.reserve + cost, limiter.capacity):
+            await asyncio.sleep(0.5)
+
+        self._spent += cost
+        return True
+
+    async def _needs_warming(self, key) -> bool:
+        expires_in = await self.client.backend.expires_in(key)
+        return expires_in is None or expires_in < self.interval
+
+    async def run_once(self) -> int:
+        """
+        Runs a single warming pass, returns the number of requests sent
+        """
+        self._spent = 0
+        client = self.client
+        warmed = 0
+
+        # (media_type, id) in list order
+        candidates = []
+        for endpoint in self.lists:
+            for page in range(1, self.list_pages + 1):
+                if not await self._spend():
+                    break
+
+                entries = await client._search_get(endpoint, page=page, instantiate_types=False, priority=self.priority)
+                for entry in entries or []:
+                    media_type = entry.get("media_type") or _ENDPOINT_MEDIA_TYPES.get(endpoint)
+                    if media_type in ("movie", "tv", "person"):
+                        candidates.append((media_type, entry["id"]))
+
+        seen = set()
+        for key in candidates:
+            if key in seen or not await self._needs_warming(key):
+                continue
+            seen.add(key)
+
+            if not await self._spend():
+                break
+
+            if await self._warm_item(*key):
+                warmed += 1
+
+        if self.query_log is not None:
+            for query in self.query_log.top(self.top_queries):
+                # Doesn't count as a hit or make the item recently used
+                key = await client.backend.find_key(query)
+                if key is not None and not await self._needs_warming(key):
+                    continue
+
+                if not await self._spend(2):
+                    break
+
+                if await client.search_multi(query, check_cache=False, priority=self.priority) is not None:
+                    warmed += 1
+
+            await self.query_log.asave()
+
+        client.metrics.inc("warmer.items", value=warmed)
+        client.metrics.inc("warmer.requests", value=self._spent)
+        log.info("Warmed {} items with {} requests".format(warmed, self._spent))
+
+        return self._spent
+
+    async def _warm_item(self, media_type, id_):
+        client = self.client
+
+        item = await client.backend.get_entry((media_type, id_))
+        if item is not None:
+            return await client._refresh(item, self.priority) is not None
+
+        # Same as what search_multi caches
+        append = ("external_ids",) if media_type == "person" else SEARCH_APPENDS
+        return await client._get_details(media_type, id_, append, None, True, False, self.priority) is not None